@@ -17,24 +17,33 @@
 
 from __future__ import annotations
 
-import json
+from typing import Any
+
 import logging
+import threading
+from collections.abc import Mapping
 from functools import partial
 from pathlib import Path
 
 from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gtk
+from nbxmpp.structs import MessageProperties
 
 from gajim.common import configpaths
 from gajim.common import types
 from gajim.common.modules.contacts import GroupchatContact
+from gajim.common.modules.contacts import GroupchatParticipant
 from gajim.gtk.message_input import MessageInputTextView
 from gajim.plugins import GajimPlugin
 from gajim.plugins.plugins_i18n import _
 
-from acronyms_expander.acronyms import DEFAULT_DATA
+from acronyms_expander.contexts import AcronymSets
 from acronyms_expander.gtk.config import ConfigDialog
+from acronyms_expander.matcher import AcronymMatcher
+from acronyms_expander.matcher import INVOKERS
+from acronyms_expander.matcher import Matcher
+from acronyms_expander.matcher import ROOT
 
 log = logging.getLogger("gajim.p.acronyms")
 
@@ -49,132 +58,361 @@ class AcronymsExpanderPlugin(GajimPlugin):
             "message_input": (self._connect, None),
             "switch_contact": (self._on_switch_contact, None),
         }
-        self._invoker = " "
         self._replace_in_progress = False
 
-        self._signal_id = None
+        # Replacements are applied together once the main loop is idle,
+        # marks keep track of the acronyms while the text changes
+        self._pending: list[tuple[Gtk.TextMark, Gtk.TextMark, str, str]] = []
+        self._replace_source_id: int | None = None
+
+        self._buffer = None
+        self._signal_ids: list[int] = []
         self._message_input = None
-        self._contact = None
+        self._message_input_signal_id: int | None = None
+        self._contact: types.ChatContactT | None = None
+        self._nicknames: set[str] = set()
 
-        self.acronyms = self._load_acronyms()
+        # Matcher state for the text in front of _state_end, which is -1
+        # if the state has to be reread from the text buffer
+        self._state = ROOT
+        self._state_end = -1
 
-    @staticmethod
-    def _load_acronyms() -> dict[str, str]:
-        try:
-            data_path = Path(configpaths.get("PLUGINS_DATA"))
-        except KeyError:
-            # PLUGINS_DATA was added in 1.0.99.1
-            return DEFAULT_DATA
+        self._sets = AcronymSets(self._get_data_path())
+        self._matcher: Matcher | None = None
 
-        path = data_path / "acronyms" / "acronyms"
-        if not path.exists():
-            return DEFAULT_DATA
+        # The global acronyms are compiled in a thread, nothing is
+        # expanded until it is done. Increased for every compile, so
+        # the result of an earlier one is dropped.
+        self._compile_thread: threading.Thread | None = None
+        self._compile_generation = 0
 
-        with path.open("r") as file:
-            acronyms = json.load(file)
-        return acronyms
+    def activate(self) -> None:
+        if self._compile_thread is None:
+            self._compile_global_matcher()
 
     @staticmethod
-    def _save_acronyms(acronyms: dict[str, str]) -> None:
+    def _get_data_path() -> Path | None:
         try:
-            data_path = Path(configpaths.get("PLUGINS_DATA"))
+            return Path(configpaths.get("PLUGINS_DATA")) / "acronyms"
         except KeyError:
             # PLUGINS_DATA was added in 1.0.99.1
-            return
-
-        path = data_path / "acronyms"
-        if not path.exists():
-            path.mkdir(parents=True)
-
-        filepath = path / "acronyms"
-        with filepath.open("w") as file:
-            json.dump(acronyms, file)
-
-    def set_acronyms(self, acronyms: dict[str, str]) -> None:
-        self.acronyms = acronyms
-        self._save_acronyms(acronyms)
+            return None
+
+    @property
+    def acronyms(self) -> Mapping[str, str]:
+        return self._sets.get_layer()
+
+    @property
+    def contact(self) -> types.ChatContactT | None:
+        return self._contact
+
+    def get_acronyms(
+        self, account: str | None = None, jid: str | None = None
+    ) -> Mapping[str, str]:
+        return self._sets.get_layer(account, jid)
+
+    @property
+    def matcher(self) -> Matcher | None:
+        # Looked up on first use, None while the global acronyms compile
+        if self._matcher is None:
+            if self._contact is None:
+                self._matcher = self._sets.get_matcher()
+            else:
+                self._matcher = self._sets.get_matcher(
+                    self._contact.account, self._contact.jid.bare
+                )
+        return self._matcher
+
+    def set_acronyms(
+        self,
+        acronyms: dict[str, str],
+        account: str | None = None,
+        jid: str | None = None,
+    ) -> None:
+        if account is None and jid is None:
+            # The running compile reads the layer which is replaced now
+            self._join_compile_thread()
+
+        self._sets.set_layer(acronyms, account, jid)
+        self._matcher = None
+        self._state_end = -1
+
+        if account is None and jid is None:
+            self._compile_global_matcher()
+
+    def _compile_global_matcher(self) -> None:
+        self._compile_generation += 1
+        # Loaded here, only compiling the automaton is left to the thread
+        acronyms = self._sets.get_layer()
+        self._compile_thread = threading.Thread(
+            target=self._compile,
+            args=(acronyms, self._compile_generation),
+            name="AcronymsCompile",
+            daemon=True,
+        )
+        self._compile_thread.start()
 
-    def _on_buffer_changed(self, message_input: MessageInputTextView) -> None:
-        if self._contact is None:
-            # If no chat has been activated yet
+    def _compile(self, acronyms: Mapping[str, str], generation: int) -> None:
+        try:
+            matcher = AcronymMatcher(acronyms)
+        except Exception:
+            log.exception("Could not compile acronyms")
             return
+        GLib.idle_add(self._on_compiled, matcher, generation)
 
-        if self._replace_in_progress:
+    def _on_compiled(self, matcher: AcronymMatcher, generation: int) -> None:
+        if generation != self._compile_generation:
             return
 
-        buffer_ = message_input.get_buffer()
-
-        if buffer_.get_char_count() < 2:
+        log.info("Compiled acronyms into %s states", matcher.state_count)
+        self._sets.set_global_matcher(matcher)
+        self._matcher = None
+        self._state_end = -1
+
+    def _join_compile_thread(self) -> None:
+        if self._compile_thread is not None:
+            self._compile_thread.join()
+
+    def _read_state(
+        self, matcher: Matcher, buffer_: Gtk.TextBuffer, offset: int
+    ) -> int:
+        # Acronyms need a token boundary in front of them, so one more
+        # char than the longest acronym is enough to restore the state
+        start_offset = max(offset - matcher.max_length - 1, 0)
+        start = buffer_.get_iter_at_offset(start_offset)
+        end = buffer_.get_iter_at_offset(offset)
+        text = buffer_.get_slice(start, end, True)
+
+        if start_offset == 0:
+            return matcher.feed(matcher.initial_state, text)
+        return matcher.feed(ROOT, text)
+
+    def _on_insert_text(
+        self, buffer_: Gtk.TextBuffer, location: Gtk.TextIter, text: str, _length: int
+    ) -> None:
+        # Connected after the default handler, location points
+        # to the end of the inserted text
+        if self._replace_in_progress:
             return
-        # Get iter at cursor
-        insert_iter = buffer_.get_iter_at_mark(buffer_.get_insert())
 
-        if insert_iter.get_offset() < 2:
-            # We need at least 2 chars and an invoker
+        matcher = self.matcher
+        if matcher is None:
+            log.debug("Acronyms are not compiled yet")
             return
 
-        # Get last char
-        insert_iter.backward_char()
-        if insert_iter.get_char() != self._invoker:
-            log.debug('"%s" not an invoker', insert_iter.get_char())
+        end_offset = location.get_offset()
+        start_offset = end_offset - len(text)
+        if start_offset != self._state_end:
+            self._state = self._read_state(matcher, buffer_, start_offset)
+        self._state_end = end_offset
+
+        acronym = None
+        for char in text:
+            if char in INVOKERS:
+                acronym = matcher.match(self._state)
+            else:
+                acronym = None
+            self._state = matcher.feed(self._state, char)
+
+        if acronym is None:
+            log.debug("No acronym in front of cursor")
             return
 
-        # Get to the start of the last word
-        # word_start_iter = insert_iter.copy()
-        result = insert_iter.backward_search(
-            self._invoker, Gtk.TextSearchFlags.VISIBLE_ONLY, None
+        self._check_acronym(
+            buffer_, acronym, matcher.get_substitute(acronym), end_offset - 1
         )
 
-        if result is None:
-            word_start_iter = buffer_.get_start_iter()
-        else:
-            _, word_start_iter = result
+    def _on_delete_range(
+        self, _buffer: Gtk.TextBuffer, _start: Gtk.TextIter, _end: Gtk.TextIter
+    ) -> None:
+        self._state_end = -1
 
-        # Get last word and cut invoker
-        last_word = word_start_iter.get_slice(insert_iter)
+    def _check_acronym(
+        self, buffer_: Gtk.TextBuffer, acronym: str, substitute: str, acronym_end: int
+    ) -> None:
+        if self._contact is None:
+            # If no chat has been activated yet
+            return
 
-        if isinstance(self._contact, GroupchatContact):
-            if last_word in self._contact.get_user_nicknames():
-                log.info("Groupchat participant has same nick as acronym")
-                return
+        if acronym in self._nicknames:
+            log.info("Groupchat participant has same nick as acronym")
+            return
 
         if self._contact.is_pm_contact:
-            if last_word == self._contact.name:
+            if acronym == self._contact.name:
                 log.info("Contact name equals acronym")
                 return
 
-        substitute = self.acronyms.get(last_word)
-        if substitute is None:
-            log.debug("%s not an acronym", last_word)
-            return
+        start = buffer_.get_iter_at_offset(acronym_end - len(acronym))
+        end = buffer_.get_iter_at_offset(acronym_end)
+        # Text typed right at the start or end must not become part of
+        # the replaced range
+        start_mark = buffer_.create_mark(None, start, False)
+        end_mark = buffer_.create_mark(None, end, True)
+        self._pending.append((start_mark, end_mark, acronym, substitute))
 
-        GLib.idle_add(
-            self._replace_text, buffer_, word_start_iter, insert_iter, substitute
-        )
+        if self._replace_source_id is None:
+            self._replace_source_id = GLib.idle_add(self._replace_pending)
 
-    def _replace_text(
-        self,
-        buffer_: Gtk.TextBuffer,
-        start: Gtk.TextIter,
-        end: Gtk.TextIter,
-        substitute: str,
-    ) -> None:
+    def _replace_pending(self) -> None:
+        self._replace_source_id = None
+        pending = self._pending
+        self._pending = []
+
+        if self._buffer is None:
+            return
+
+        buffer_ = self._buffer
         self._replace_in_progress = True
-        buffer_.delete(start, end)
-        buffer_.insert(start, substitute)
+        # One user action per idle cycle, so all replacements
+        # are undone at once and only notify once
+        buffer_.begin_user_action()
+        for start_mark, end_mark, acronym, substitute in pending:
+            if start_mark.get_buffer() is not buffer_:
+                # The buffer was replaced in the meantime
+                self._delete_marks(start_mark, end_mark)
+                continue
+
+            start = buffer_.get_iter_at_mark(start_mark)
+            end = buffer_.get_iter_at_mark(end_mark)
+            if buffer_.get_slice(start, end, True) == acronym:
+                buffer_.delete(start, end)
+                buffer_.insert(start, substitute)
+            else:
+                log.debug("Acronym was changed before it could be replaced")
+
+            self._delete_marks(start_mark, end_mark)
+        buffer_.end_user_action()
         self._replace_in_progress = False
 
+    def _clear_pending(self) -> None:
+        if self._replace_source_id is not None:
+            GLib.source_remove(self._replace_source_id)
+            self._replace_source_id = None
+
+        for start_mark, end_mark, _acronym, _substitute in self._pending:
+            self._delete_marks(start_mark, end_mark)
+        self._pending = []
+
+    @staticmethod
+    def _delete_marks(*marks: Gtk.TextMark) -> None:
+        for mark in marks:
+            buffer_ = mark.get_buffer()
+            if buffer_ is not None:
+                buffer_.delete_mark(mark)
+
     def _on_switch_contact(self, contact: types.ChatContactT) -> None:
+        if isinstance(self._contact, GroupchatContact):
+            self._contact.disconnect_all_from_obj(self)
+
         self._contact = contact
+        self._nicknames.clear()
+        self._track_buffer()
+
+        # The matcher of the context is looked up or compiled on first
+        # use, states of one matcher are meaningless for another
+        self._matcher = None
+        self._state_end = -1
+
+        if isinstance(contact, GroupchatContact):
+            # Kept up to date from occupant events, so checking for
+            # collisions does not build the nickname list on every invoker
+            self._nicknames.update(contact.get_user_nicknames())
+            contact.connect("user-joined", self._on_user_joined)
+            contact.connect("user-left", self._on_user_left)
+            contact.connect("user-nickname-changed", self._on_user_nickname_changed)
+            contact.connect("room-joined", self._on_room_joined)
+
+    def _on_user_joined(
+        self,
+        _contact: GroupchatContact,
+        _signal_name: str,
+        user_contact: GroupchatParticipant,
+        *args: Any,
+    ) -> None:
+        self._nicknames.add(user_contact.name)
+
+    def _on_user_left(
+        self,
+        _contact: GroupchatContact,
+        _signal_name: str,
+        user_contact: GroupchatParticipant,
+        *args: Any,
+    ) -> None:
+        self._nicknames.discard(user_contact.name)
+
+    def _on_user_nickname_changed(
+        self,
+        _contact: GroupchatContact,
+        _signal_name: str,
+        old_contact: GroupchatParticipant,
+        properties: MessageProperties,
+    ) -> None:
+        self._nicknames.discard(old_contact.name)
+        assert properties.muc_user is not None
+        if properties.muc_user.nick is not None:
+            self._nicknames.add(properties.muc_user.nick)
+
+    def _on_room_joined(self, contact: GroupchatContact, _signal_name: str) -> None:
+        self._nicknames = set(contact.get_user_nicknames())
 
     def _connect(self, message_input: MessageInputTextView) -> None:
+        self._disconnect_message_input()
         self._message_input = message_input
-        self._signal_id = message_input.connect(
-            "buffer-changed", self._on_buffer_changed
+        self._message_input_signal_id = message_input.connect(
+            "notify::buffer", self._on_buffer_notify
         )
+        self._track_buffer()
+
+    def _disconnect_message_input(self) -> None:
+        self._untrack_buffer()
+        if self._message_input is None:
+            return
+
+        if self._message_input_signal_id is not None and (
+            GObject.signal_handler_is_connected(
+                self._message_input, self._message_input_signal_id
+            )
+        ):
+            self._message_input.disconnect(self._message_input_signal_id)
+        self._message_input_signal_id = None
+        self._message_input = None
+
+    def _on_buffer_notify(
+        self, _message_input: MessageInputTextView, _param: GObject.ParamSpec
+    ) -> None:
+        self._track_buffer()
+
+    def _track_buffer(self) -> None:
+        if self._message_input is None:
+            return
+
+        # The message input uses a buffer per chat
+        buffer_ = self._message_input.get_buffer()
+        if buffer_ is self._buffer:
+            return
+
+        self._untrack_buffer()
+        self._buffer = buffer_
+        self._signal_ids = [
+            buffer_.connect_after("insert-text", self._on_insert_text),
+            buffer_.connect("delete-range", self._on_delete_range),
+        ]
+
+    def _untrack_buffer(self) -> None:
+        self._clear_pending()
+        self._state_end = -1
+        if self._buffer is None:
+            return
+
+        for signal_id in self._signal_ids:
+            if GObject.signal_handler_is_connected(self._buffer, signal_id):
+                self._buffer.disconnect(signal_id)
+        self._signal_ids = []
+        self._buffer = None
 
     def deactivate(self) -> None:
-        assert self._message_input is not None
-        assert self._signal_id is not None
-        if GObject.signal_handler_is_connected(self._message_input, self._signal_id):
-            self._message_input.disconnect(self._signal_id)
+        if isinstance(self._contact, GroupchatContact):
+            self._contact.disconnect_all_from_obj(self)
+
+        self._disconnect_message_input()
@@ -0,0 +1,217 @@
+# This file is part of Acronyms Expander.
+#
+# Acronyms Expander is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; version 3 only.
+#
+# Acronyms Expander is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Acronyms Expander. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Layered acronym sets
+
+Acronyms of a contact override those of its account, which override the
+global acronyms. Every layer is stored in its own compact file, account
+and contact layers in the contexts directory, named after the quoted
+account or account/jid.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import OrderedDict
+from collections.abc import Mapping
+from pathlib import Path
+from urllib.parse import quote
+from urllib.parse import unquote
+
+from acronyms_expander.acronyms import DEFAULT_DATA
+from acronyms_expander.matcher import AcronymMatcher
+from acronyms_expander.matcher import LayeredMatcher
+from acronyms_expander.matcher import Matcher
+from acronyms_expander.storage import CompactAcronyms
+from acronyms_expander.storage import import_json
+from acronyms_expander.storage import write_compact
+
+log = logging.getLogger("gajim.p.acronyms")
+
+MATCHER_CACHE_SIZE = 16
+
+# (account, jid), (None, None) is the global layer
+# and (account, None) the layer of an account
+LayerKey = tuple[str | None, str | None]
+
+GLOBAL: LayerKey = (None, None)
+
+
+def _get_filename(key: LayerKey) -> str:
+    account, jid = key
+    assert account is not None
+    name = account if jid is None else f"{account}/{jid}"
+    return quote(name, safe="") + ".bin"
+
+
+def _get_key(filename: str) -> LayerKey:
+    account, _, jid = unquote(filename.removesuffix(".bin")).partition("/")
+    return account, jid or None
+
+
+class AcronymSets:
+    def __init__(self, data_path: Path | None) -> None:
+        self._data_path = data_path
+        self._layers: dict[LayerKey, Mapping[str, str]] = {}
+        # The global matcher is shared by all contexts, the LRU only
+        # holds the overlays of contexts with own layers
+        self._global_matcher: AcronymMatcher | None = None
+        self._matchers: OrderedDict[tuple[LayerKey, ...], LayeredMatcher] = (
+            OrderedDict()
+        )
+
+        # Listed once, so resolving a context never touches the disk
+        self._available: set[LayerKey] = set()
+        contexts_path = self._get_contexts_path()
+        if contexts_path is not None and contexts_path.exists():
+            self._available = {
+                _get_key(path.name) for path in contexts_path.glob("*.bin")
+            }
+
+    def _get_contexts_path(self) -> Path | None:
+        if self._data_path is None:
+            return None
+        return self._data_path / "contexts"
+
+    def _get_path(self, key: LayerKey) -> Path | None:
+        if self._data_path is None:
+            return None
+        if key == GLOBAL:
+            return self._data_path / "acronyms.bin"
+
+        contexts_path = self._get_contexts_path()
+        assert contexts_path is not None
+        return contexts_path / _get_filename(key)
+
+    def get_layer(
+        self, account: str | None = None, jid: str | None = None
+    ) -> Mapping[str, str]:
+        key = (account, jid)
+        layer = self._layers.get(key)
+        if layer is None:
+            layer = self._layers[key] = self._load(key)
+        return layer
+
+    def _load(self, key: LayerKey) -> Mapping[str, str]:
+        path = self._get_path(key)
+        if path is not None and path.exists():
+            try:
+                return CompactAcronyms(path)
+            except Exception:
+                log.exception("Could not load %s", path)
+
+        if key != GLOBAL:
+            return {}
+
+        if self._data_path is None:
+            return DEFAULT_DATA
+
+        # Acronyms were stored as JSON before
+        json_path = self._data_path / "acronyms"
+        if not json_path.exists():
+            return DEFAULT_DATA
+
+        try:
+            acronyms = import_json(json_path)
+        except Exception:
+            log.exception("Could not load %s", json_path)
+            return DEFAULT_DATA
+
+        self._save(key, acronyms)
+        return acronyms
+
+    def _save(self, key: LayerKey, acronyms: Mapping[str, str]) -> None:
+        path = self._get_path(key)
+        if path is None:
+            return
+
+        if not path.parent.exists():
+            path.parent.mkdir(parents=True)
+
+        write_compact(path, acronyms)
+
+    def set_layer(
+        self,
+        acronyms: dict[str, str],
+        account: str | None = None,
+        jid: str | None = None,
+    ) -> None:
+        key = (account, jid)
+        layer = self._layers.get(key)
+        if isinstance(layer, CompactAcronyms):
+            # Release the mapping, the file is about to be replaced
+            layer.close()
+
+        self._layers[key] = acronyms
+        self._save(key, acronyms)
+        if key != GLOBAL:
+            self._available.add(key)
+
+        if key == GLOBAL:
+            # Compiled again by the caller, see set_global_matcher()
+            self._global_matcher = None
+            self._matchers.clear()
+            return
+
+        for layer_keys in list(self._matchers):
+            if key in layer_keys:
+                del self._matchers[layer_keys]
+
+    def _resolve(self, account: str | None, jid: str | None) -> tuple[LayerKey, ...]:
+        layer_keys: list[LayerKey] = []
+        if (account, None) in self._available:
+            layer_keys.append((account, None))
+        if jid is not None and (account, jid) in self._available:
+            layer_keys.append((account, jid))
+        return tuple(layer_keys)
+
+    def set_global_matcher(self, matcher: AcronymMatcher) -> None:
+        """
+        Set the matcher compiled from the global layer. Compiling a large
+        layer takes long, so it is left to the caller.
+        """
+        self._global_matcher = matcher
+        self._matchers.clear()
+
+    def get_matcher(
+        self, account: str | None = None, jid: str | None = None
+    ) -> Matcher | None:
+        """
+        Return the matcher for a context, contexts without own layers
+        share the matcher of the global acronyms. None until the global
+        matcher is set.
+        """
+        if self._global_matcher is None:
+            return None
+
+        layer_keys = self._resolve(account, jid)
+        if not layer_keys:
+            return self._global_matcher
+
+        matcher = self._matchers.get(layer_keys)
+        if matcher is not None:
+            self._matchers.move_to_end(layer_keys)
+            return matcher
+
+        overlay: dict[str, str] = {}
+        for key in layer_keys:
+            overlay.update(self.get_layer(*key))
+
+        matcher = self._matchers[layer_keys] = LayeredMatcher(
+            self._global_matcher, AcronymMatcher(overlay), overlay
+        )
+        while len(self._matchers) > MATCHER_CACHE_SIZE:
+            self._matchers.popitem(last=False)
+        return matcher
@@ -19,27 +19,62 @@ from __future__ import annotations
 from typing import cast
 from typing import TYPE_CHECKING
 
+import logging
+import threading
+from collections.abc import Callable
+from collections.abc import Mapping
 from pathlib import Path
 
+from gi.repository import Gio
+from gi.repository import GLib
+from gi.repository import GObject
 from gi.repository import Gtk
 
 from gajim.gtk.window import GajimAppWindow
 from gajim.plugins.helpers import get_builder
 from gajim.plugins.plugins_i18n import _
 
+from acronyms_expander.storage import export_json
+from acronyms_expander.storage import import_json
+
 if TYPE_CHECKING:
     from ..acronyms_expander import AcronymsExpanderPlugin
 
+log = logging.getLogger("gajim.p.acronyms")
+
+LOAD_CHUNK_SIZE = 500
+
 
 class ConfigBuilder(Gtk.Builder):
-    acronyms_store: Gtk.ListStore
     box: Gtk.Box
-    acronyms_treeview: Gtk.TreeView
-    selection: Gtk.TreeSelection
-    acronym_renderer: Gtk.CellRendererText
-    sub_renderer: Gtk.CellRendererText
+    context_dropdown: Gtk.DropDown
+    search_entry: Gtk.SearchEntry
+    acronyms_view: Gtk.ColumnView
     add_button: Gtk.Button
     remove_button: Gtk.Button
+    spinner: Gtk.Spinner
+    status_label: Gtk.Label
+    import_button: Gtk.Button
+    export_button: Gtk.Button
+
+
+class AcronymItem(GObject.Object):
+    acronym = GObject.Property(type=str, default="")
+    substitute = GObject.Property(type=str, default="")
+    search_text = GObject.Property(type=str, default="")
+
+    def __init__(
+        self, acronym: str, substitute: str, original_acronym: str | None = None
+    ) -> None:
+        GObject.Object.__init__(self)
+        # Key of the saved entry, None if the item was added in the dialog
+        self.original_acronym = original_acronym
+        self.set_values(acronym, substitute)
+
+    def set_values(self, acronym: str, substitute: str) -> None:
+        self.acronym = acronym
+        self.substitute = substitute
+        self.search_text = f"{acronym} {substitute}".casefold()
 
 
 class ConfigDialog(GajimAppWindow):
@@ -62,66 +97,374 @@ class ConfigDialog(GajimAppWindow):
         )
 
         self._plugin = plugin
+        self._loading_cancelled = False
+        # Increased for every load, chunks of earlier loads are dropped
+        self._generation = 0
 
-        self.set_child(self._ui.box)
+        # Acronyms are edited for all chats, the account or the contact
+        # of the current chat, as (account, jid) like in AcronymSets
+        self._contexts: list[tuple[str | None, str | None]] = [(None, None)]
+        labels = [_("All Chats")]
+        contact = self._plugin.contact
+        if contact is not None:
+            self._contexts.append((contact.account, None))
+            labels.append(_("Account %s") % contact.account)
+            self._contexts.append((contact.account, contact.jid.bare))
+            labels.append(_("Current Chat (%s)") % contact.name)
+        self._context = self._contexts[0]
+        self._ui.context_dropdown.set_model(Gtk.StringList.new(labels))
+
+        # Only the changes are applied to the saved acronyms on close,
+        # entries which were never touched are not read again
+        self._edited: set[AcronymItem] = set()
+        self._removed: set[str] = set()
+
+        # Labels created by the factories and the property they edit
+        self._cells: dict[Gtk.EditableLabel, tuple[Gtk.ListItem, str]] = {}
+        # Labels follow the bound item, which may change while it is shown
+        self._bindings: dict[Gtk.EditableLabel, GObject.Binding] = {}
 
-        self._fill_list()
+        self._model = Gio.ListStore(item_type=AcronymItem)
 
-        self._connect(self._ui.acronym_renderer, "edited", self._on_acronym_edited)
-        self._connect(self._ui.sub_renderer, "edited", self._on_substitute_edited)
+        expression = Gtk.PropertyExpression.new(AcronymItem, None, "search-text")
+        self._filter = Gtk.StringFilter(
+            expression=expression,
+            ignore_case=False,
+            match_mode=Gtk.StringFilterMatchMode.SUBSTRING,
+        )
+        filter_model = Gtk.FilterListModel(model=self._model, filter=self._filter)
+        filter_model.set_incremental(True)
+
+        self._selection = Gtk.MultiSelection(model=filter_model)
+        self._ui.acronyms_view.set_model(self._selection)
+        self._add_column(_("Acronym"), self._on_setup_acronym)
+        self._add_column(_("Substitute"), self._on_setup_substitute)
+
+        self.set_child(self._ui.box)
+
+        self._connect(self._ui.search_entry, "search-changed", self._on_search)
         self._connect(self._ui.add_button, "clicked", self._on_add_clicked)
         self._connect(self._ui.remove_button, "clicked", self._on_remove_clicked)
+        self._connect(self._ui.import_button, "clicked", self._on_import_clicked)
+        self._connect(self._ui.export_button, "clicked", self._on_export_clicked)
+        self._connect(
+            self._ui.context_dropdown, "notify::selected", self._on_context_changed
+        )
         self._connect(self, "close-request", self._on_close_request)
 
+        self._load_context()
+
     def _cleanup(self) -> None:
+        self._loading_cancelled = True
+        for binding in self._bindings.values():
+            binding.unbind()
+        self._bindings.clear()
+        self._cells.clear()
+        self._edited.clear()
         del self._plugin
 
-    def _fill_list(self) -> None:
-        for acronym, substitute in self._plugin.acronyms.items():
-            self._ui.acronyms_store.append([acronym, substitute])
+    def _add_column(
+        self,
+        title: str,
+        on_setup: Callable[[Gtk.SignalListItemFactory, Gtk.ListItem], None],
+    ) -> None:
+        factory = Gtk.SignalListItemFactory()
+        self._connect(factory, "setup", on_setup)
+        self._connect(factory, "bind", self._on_bind)
+        self._connect(factory, "unbind", self._on_unbind)
+        column = Gtk.ColumnViewColumn(
+            title=title, factory=factory, expand=True, resizable=True
+        )
+        self._ui.acronyms_view.append_column(column)
+
+    def _setup_cell(self, list_item: Gtk.ListItem, property_name: str) -> None:
+        label = Gtk.EditableLabel()
+        self._cells[label] = (list_item, property_name)
+        self._connect(label, "notify::editing", self._on_editing_changed)
+        list_item.set_child(label)
 
-    def _on_acronym_edited(
-        self, _renderer: Gtk.CellRendererText, path: str, new_text: str
+    def _on_setup_acronym(
+        self, _factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem
     ) -> None:
-        iter_ = self._ui.acronyms_store.get_iter(path)
-        self._ui.acronyms_store.set_value(iter_, 0, new_text)
+        self._setup_cell(list_item, "acronym")
 
-    def _on_substitute_edited(
-        self, _renderer: Gtk.CellRendererText, path: str, new_text: str
+    def _on_setup_substitute(
+        self, _factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem
     ) -> None:
-        iter_ = self._ui.acronyms_store.get_iter(path)
-        self._ui.acronyms_store.set_value(iter_, 1, new_text)
+        self._setup_cell(list_item, "substitute")
+
+    def _on_bind(
+        self, _factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem
+    ) -> None:
+        label = cast(Gtk.EditableLabel, list_item.get_child())
+        _list_item, property_name = self._cells[label]
+        item = cast(AcronymItem, list_item.get_item())
+        self._bindings[label] = item.bind_property(
+            property_name, label, "text", GObject.BindingFlags.SYNC_CREATE
+        )
+
+    def _on_unbind(
+        self, _factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem
+    ) -> None:
+        label = cast(Gtk.EditableLabel, list_item.get_child())
+        binding = self._bindings.pop(label, None)
+        if binding is not None:
+            binding.unbind()
+
+    def _on_editing_changed(
+        self, label: Gtk.EditableLabel, _param: GObject.ParamSpec
+    ) -> None:
+        if label.get_editing():
+            return
+
+        list_item, property_name = self._cells[label]
+        item = cast(AcronymItem | None, list_item.get_item())
+        if item is None:
+            return
+
+        text = label.get_text()
+        if property_name == "acronym":
+            if text == item.acronym:
+                return
+            item.set_values(text, item.substitute)
+        else:
+            if text == item.substitute:
+                return
+            item.set_values(item.acronym, text)
+
+        # New rows only count as an edit once they are complete
+        if item.original_acronym is not None or (item.acronym and item.substitute):
+            self._edited.add(item)
+
+    def _load_context(self) -> None:
+        self._generation += 1
+        self._model.remove_all()
+        self._edited.clear()
+        self._removed.clear()
+        self._set_busy(True)
+
+        acronyms = self._plugin.get_acronyms(*self._context)
+        self._loader = threading.Thread(
+            target=self._load_acronyms,
+            args=(self._generation, acronyms),
+            daemon=True,
+        )
+        self._loader.start()
+
+    def _on_context_changed(
+        self, dropdown: Gtk.DropDown, _param: GObject.ParamSpec
+    ) -> None:
+        self._save()
+        self._context = self._contexts[dropdown.get_selected()]
+        self._load_context()
+
+    def _load_acronyms(self, generation: int, acronyms: Mapping[str, str]) -> None:
+        # Runs in a worker thread, large acronym packs must not
+        # block the main loop while the dialog opens
+        entries = sorted(acronyms.items())
+        for index in range(0, len(entries), LOAD_CHUNK_SIZE):
+            GLib.idle_add(
+                self._add_items, generation, entries[index : index + LOAD_CHUNK_SIZE]
+            )
+        GLib.idle_add(self._on_acronyms_loaded, generation)
+
+    def _add_items(self, generation: int, entries: list[tuple[str, str]]) -> bool:
+        if self._loading_cancelled or generation != self._generation:
+            return False
+        items = [
+            AcronymItem(acronym, substitute, acronym) for acronym, substitute in entries
+        ]
+        self._model.splice(self._model.get_n_items(), 0, items)
+        return False
+
+    def _on_acronyms_loaded(self, generation: int) -> bool:
+        if not self._loading_cancelled and generation == self._generation:
+            self._set_busy(False)
+        return False
+
+    def _set_busy(self, busy: bool) -> None:
+        self._ui.spinner.set_spinning(busy)
+        self._ui.spinner.set_visible(busy)
+        self._ui.import_button.set_sensitive(not busy)
+        self._ui.export_button.set_sensitive(not busy)
+        self._ui.context_dropdown.set_sensitive(not busy)
+
+    def _on_search(self, entry: Gtk.SearchEntry) -> None:
+        self._filter.set_search(entry.get_text().casefold())
 
     def _on_add_clicked(self, _button: Gtk.Button) -> None:
-        self._ui.acronyms_store.append(["", ""])
-        row = self._ui.acronyms_store[-1]
-        self._ui.acronyms_treeview.scroll_to_cell(row.path, None, False, 0, 0)
-        self._ui.selection.unselect_all()
-        self._ui.selection.select_path(row.path)
+        self._ui.search_entry.set_text("")
+        item = AcronymItem("", "")
+        self._model.insert(0, item)
+        self._ui.acronyms_view.scroll_to(0, None, Gtk.ListScrollFlags.SELECT, None)
 
     def _on_remove_clicked(self, _button: Gtk.Button) -> None:
-        res = self._ui.selection.get_selected_rows()
-        if res is None:
+        selected = self._selection.get_selection()
+        items = [
+            cast(AcronymItem, self._selection.get_item(selected.get_nth(index)))
+            for index in range(selected.get_size())
+        ]
+
+        positions: list[int] = []
+        for item in items:
+            found, position = self._model.find(item)
+            if found:
+                positions.append(position)
+
+            self._edited.discard(item)
+            if item.original_acronym is not None:
+                self._removed.add(item.original_acronym)
+
+        for position in sorted(positions, reverse=True):
+            self._model.remove(position)
+
+    @staticmethod
+    def _get_json_dialog(title: str) -> Gtk.FileDialog:
+        filter_ = Gtk.FileFilter(name=_("JSON Files"))
+        filter_.add_suffix("json")
+        filters = Gio.ListStore(item_type=Gtk.FileFilter)
+        filters.append(filter_)
+        return Gtk.FileDialog(title=title, filters=filters, modal=True)
+
+    def _on_import_clicked(self, _button: Gtk.Button) -> None:
+        dialog = self._get_json_dialog(_("Import Acronyms"))
+        dialog.open(self, None, self._on_import_file_chosen)
+
+    def _on_import_file_chosen(
+        self, dialog: Gtk.FileDialog, result: Gio.AsyncResult
+    ) -> None:
+        try:
+            file = dialog.open_finish(result)
+        except GLib.Error:
+            # Cancelled
             return
 
-        model, paths = res
-        references: list[Gtk.TreeRowReference] = []
-        for path in paths:
-            ref = Gtk.TreeRowReference.new(model, path)
-            assert ref is not None
-            references.append(ref)
+        path = file.get_path() if file is not None else None
+        if path is None:
+            return
 
-        for ref in references:
-            path = ref.get_path()
-            assert path is not None
-            iter_ = model.get_iter(path)
-            self._ui.acronyms_store.remove(iter_)
+        self._set_busy(True)
+        self._ui.status_label.set_text(_("Importing…"))
+        thread = threading.Thread(
+            target=self._import_file, args=(Path(path),), daemon=True
+        )
+        thread.start()
 
-    def _on_close_request(self, win: Gtk.ApplicationWindow) -> None:
-        acronyms: dict[str, str] = {}
-        for row in self._ui.acronyms_store:
-            acronym, substitute = row
-            if not acronym or not substitute:
+    def _import_file(self, path: Path) -> None:
+        # Runs in a worker thread
+        try:
+            acronyms = import_json(path)
+        except Exception as error:
+            log.warning("Could not import %s: %s", path, error)
+            GLib.idle_add(self._on_import_failed, str(error))
+            return
+        GLib.idle_add(self._on_imported, acronyms)
+
+    def _on_import_failed(self, error: str) -> bool:
+        if not self._loading_cancelled:
+            self._set_busy(False)
+            self._ui.status_label.set_text(_("Import failed: %s") % error)
+        return False
+
+    def _on_imported(self, acronyms: dict[str, str]) -> bool:
+        if self._loading_cancelled:
+            return False
+
+        # Imported acronyms replace existing entries with the same acronym
+        items = {item.acronym: item for item in cast(list[AcronymItem], self._model)}
+        new_items: list[AcronymItem] = []
+        for acronym, substitute in acronyms.items():
+            item = items.get(acronym)
+            if item is None:
+                item = AcronymItem(acronym, substitute)
+                new_items.append(item)
+            elif item.substitute != substitute:
+                item.set_values(acronym, substitute)
+            else:
                 continue
-            acronyms[acronym] = substitute
-        self._plugin.set_acronyms(acronyms)
+            self._edited.add(item)
+
+        self._model.splice(self._model.get_n_items(), 0, new_items)
+        self._set_busy(False)
+        self._ui.status_label.set_text(
+            _("Imported %s acronyms") % len(acronyms) if acronyms else ""
+        )
+        return False
+
+    def _on_export_clicked(self, _button: Gtk.Button) -> None:
+        dialog = self._get_json_dialog(_("Export Acronyms"))
+        dialog.set_initial_name("acronyms.json")
+        dialog.save(self, None, self._on_export_file_chosen)
+
+    def _on_export_file_chosen(
+        self, dialog: Gtk.FileDialog, result: Gio.AsyncResult
+    ) -> None:
+        try:
+            file = dialog.save_finish(result)
+        except GLib.Error:
+            # Cancelled
+            return
+
+        path = file.get_path() if file is not None else None
+        if path is None:
+            return
+
+        self._set_busy(True)
+        self._ui.status_label.set_text(_("Exporting…"))
+        thread = threading.Thread(
+            target=self._export_file,
+            args=(Path(path), self._get_acronyms()),
+            daemon=True,
+        )
+        thread.start()
+
+    def _export_file(self, path: Path, acronyms: dict[str, str]) -> None:
+        # Runs in a worker thread
+        try:
+            export_json(path, acronyms)
+        except Exception as error:
+            log.warning("Could not export %s: %s", path, error)
+            GLib.idle_add(self._on_exported, _("Export failed: %s") % error)
+            return
+        GLib.idle_add(self._on_exported, _("Exported %s acronyms") % len(acronyms))
+
+    def _on_exported(self, status: str) -> bool:
+        if not self._loading_cancelled:
+            self._set_busy(False)
+            self._ui.status_label.set_text(status)
+        return False
+
+    def _get_acronyms(self) -> dict[str, str]:
+        acronyms: dict[str, str] = {}
+        for item in cast(list[AcronymItem], self._model):
+            if item.acronym and item.substitute:
+                acronyms[item.acronym] = item.substitute
+        return acronyms
+
+    def _on_close_request(self, win: Gtk.ApplicationWindow) -> None:
+        self._loading_cancelled = True
+        self._save()
+
+    def _save(self) -> None:
+        if not self._edited and not self._removed:
+            return
+
+        # The loader reads the memory-mapped acronyms, which are
+        # closed when the new acronyms are saved
+        self._loader.join()
+
+        acronyms = dict(self._plugin.get_acronyms(*self._context))
+        for acronym in self._removed:
+            acronyms.pop(acronym, None)
+
+        # Renamed entries are removed first, so renaming one acronym
+        # to the old name of another keeps the new entry
+        for item in self._edited:
+            if item.original_acronym is not None:
+                acronyms.pop(item.original_acronym, None)
+
+        for item in self._edited:
+            if item.acronym and item.substitute:
+                acronyms[item.acronym] = item.substitute
+
+        self._plugin.set_acronyms(acronyms, *self._context)
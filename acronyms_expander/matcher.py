@@ -0,0 +1,193 @@
+# This file is part of Acronyms Expander.
+#
+# Acronyms Expander is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; version 3 only.
+#
+# Acronyms Expander is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Acronyms Expander. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import string
+from collections import deque
+from collections.abc import Mapping
+
+# Characters which trigger the expansion of the acronym in front of them
+INVOKERS = frozenset(" ,.!?;")
+
+# Characters after which a new token starts. Punctuation does not start
+# one, so acronyms are not expanded inside URLs, addresses or paths
+DELIMITERS = frozenset(string.whitespace)
+
+# Symbol fed to the automaton after every delimiter, it is above the
+# highest unicode code point so it never collides with a character
+BOUNDARY = 0x110000
+SYMBOL_BITS = 21
+
+ROOT = 0
+
+
+def _get_symbols(text: str) -> list[int]:
+    symbols: list[int] = []
+    for char in text:
+        symbols.append(ord(char))
+        if char in DELIMITERS:
+            symbols.append(BOUNDARY)
+    return symbols
+
+
+class AcronymMatcher:
+    """
+    Aho-Corasick automaton over all acronyms. Every acronym has to start
+    at the start of the text or after whitespace and may itself contain
+    spaces or punctuation.
+
+    The caller keeps the state for the text in front of the cursor and
+    feeds typed characters into it, each costs amortized constant time.
+    """
+
+    def __init__(self, acronyms: Mapping[str, str]) -> None:
+        self._acronyms = acronyms
+        self.max_length = max(map(len, acronyms), default=0)
+
+        self._goto: dict[int, int] = {}
+        self._fail: list[int] = [ROOT]
+        self._output: list[str | None] = [None]
+
+        for acronym in acronyms:
+            if acronym:
+                self._add(acronym)
+        self._build_links()
+
+    def _add(self, acronym: str) -> None:
+        state = ROOT
+        for symbol in [BOUNDARY, *_get_symbols(acronym)]:
+            key = state << SYMBOL_BITS | symbol
+            next_state = self._goto.get(key)
+            if next_state is None:
+                next_state = len(self._fail)
+                self._goto[key] = next_state
+                self._fail.append(ROOT)
+                self._output.append(None)
+            state = next_state
+        self._output[state] = acronym
+
+    def _build_links(self) -> None:
+        children: dict[int, list[tuple[int, int]]] = {}
+        for key, child in self._goto.items():
+            children.setdefault(key >> SYMBOL_BITS, []).append(
+                (key & (1 << SYMBOL_BITS) - 1, child)
+            )
+
+        # Breadth first, so the failure state of the parent is final
+        queue = deque(child for _, child in children.get(ROOT, []))
+        while queue:
+            state = queue.popleft()
+            for symbol, child in children.get(state, []):
+                fail = self._fail[state]
+                while fail != ROOT and fail << SYMBOL_BITS | symbol not in self._goto:
+                    fail = self._fail[fail]
+                fail = self._goto.get(fail << SYMBOL_BITS | symbol, ROOT)
+                self._fail[child] = fail
+
+                # Keep the longest acronym ending here, or the longest
+                # acronym ending in the failure state
+                if self._output[child] is None:
+                    self._output[child] = self._output[fail]
+                queue.append(child)
+
+    @property
+    def state_count(self) -> int:
+        return len(self._fail)
+
+    @property
+    def initial_state(self) -> int:
+        """
+        State at the start of the text, which is a token boundary
+        """
+        return self._step(ROOT, BOUNDARY)
+
+    def _step(self, state: int, symbol: int) -> int:
+        while True:
+            next_state = self._goto.get(state << SYMBOL_BITS | symbol)
+            if next_state is not None:
+                return next_state
+            if state == ROOT:
+                return ROOT
+            state = self._fail[state]
+
+    def feed(self, state: int, text: str) -> int:
+        for char in text:
+            state = self._step(state, ord(char))
+            if char in DELIMITERS:
+                state = self._step(state, BOUNDARY)
+        return state
+
+    def match(self, state: int) -> str | None:
+        """
+        Return the longest acronym ending at the given state
+        """
+        return self._output[state]
+
+    def get_substitute(self, acronym: str) -> str:
+        return self._acronyms[acronym]
+
+
+class LayeredMatcher:
+    """
+    Matches the acronyms of a small overlay on top of a shared base
+    matcher, so contexts with own acronyms do not compile the base again.
+
+    Both states are packed into one int, ROOT is the root of both.
+    The longer acronym wins, the overlay wins between equal acronyms.
+    """
+
+    def __init__(
+        self,
+        base: AcronymMatcher,
+        overlay: AcronymMatcher,
+        overlay_acronyms: Mapping[str, str],
+    ) -> None:
+        self._base = base
+        self._overlay = overlay
+        self._overlay_acronyms = overlay_acronyms
+        self._overlay_states = overlay.state_count
+        self.max_length = max(base.max_length, overlay.max_length)
+
+    def _pack(self, base_state: int, overlay_state: int) -> int:
+        return base_state * self._overlay_states + overlay_state
+
+    @property
+    def initial_state(self) -> int:
+        return self._pack(self._base.initial_state, self._overlay.initial_state)
+
+    def feed(self, state: int, text: str) -> int:
+        base_state, overlay_state = divmod(state, self._overlay_states)
+        return self._pack(
+            self._base.feed(base_state, text), self._overlay.feed(overlay_state, text)
+        )
+
+    def match(self, state: int) -> str | None:
+        base_state, overlay_state = divmod(state, self._overlay_states)
+        acronym = self._overlay.match(overlay_state)
+        base_acronym = self._base.match(base_state)
+        if acronym is None or (
+            base_acronym is not None and len(base_acronym) > len(acronym)
+        ):
+            return base_acronym
+        return acronym
+
+    def get_substitute(self, acronym: str) -> str:
+        substitute = self._overlay_acronyms.get(acronym)
+        if substitute is None:
+            return self._base.get_substitute(acronym)
+        return substitute
+
+
+Matcher = AcronymMatcher | LayeredMatcher
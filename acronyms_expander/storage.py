@@ -0,0 +1,130 @@
+# This file is part of Acronyms Expander.
+#
+# Acronyms Expander is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; version 3 only.
+#
+# Acronyms Expander is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Acronyms Expander. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compact acronym storage
+
+The file starts with MAGIC and the number of entries, followed by an
+index of (key offset, key length, value offset, value length) per entry,
+sorted by the UTF-8 encoded key, and a blob with all strings. The file is
+memory-mapped, lookups are a binary search over the index, so nothing has
+to be parsed when the file is opened.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from collections.abc import Iterator
+from collections.abc import Mapping
+from pathlib import Path
+
+MAGIC = b"GAJACRO1"
+HEADER = struct.Struct("<8sI")
+ENTRY = struct.Struct("<IIII")
+
+
+class InvalidAcronymsFile(Exception):
+    pass
+
+
+class CompactAcronyms(Mapping[str, str]):
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as file:
+            try:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can not be mapped
+                raise InvalidAcronymsFile("File is empty")
+
+        try:
+            magic, self._count = HEADER.unpack_from(self._mmap)
+        except struct.error:
+            self._mmap.close()
+            raise InvalidAcronymsFile("File too short")
+
+        self._blob_start = HEADER.size + self._count * ENTRY.size
+        if magic != MAGIC or len(self._mmap) < self._blob_start:
+            self._mmap.close()
+            raise InvalidAcronymsFile("Invalid header")
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def _get_entry(self, index: int) -> tuple[int, int, int, int]:
+        return ENTRY.unpack_from(self._mmap, HEADER.size + index * ENTRY.size)
+
+    def _get_bytes(self, offset: int, length: int) -> bytes:
+        start = self._blob_start + offset
+        return self._mmap[start : start + length]
+
+    def __getitem__(self, key: str) -> str:
+        encoded_key = key.encode()
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, value_offset, value_length = self._get_entry(middle)
+            current_key = self._get_bytes(key_offset, key_length)
+            if current_key < encoded_key:
+                low = middle + 1
+            elif current_key > encoded_key:
+                high = middle
+            else:
+                return self._get_bytes(value_offset, value_length).decode()
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(self._count):
+            key_offset, key_length, _, _ = self._get_entry(index)
+            yield self._get_bytes(key_offset, key_length).decode()
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def write_compact(path: Path, acronyms: Mapping[str, str]) -> None:
+    entries = sorted((key.encode(), value.encode()) for key, value in acronyms.items())
+
+    index = bytearray(HEADER.pack(MAGIC, len(entries)))
+    blob = bytearray()
+    for key, value in entries:
+        index += ENTRY.pack(len(blob), len(key), len(blob) + len(key), len(value))
+        blob += key
+        blob += value
+
+    # Write to a temporary file and rename it,
+    # so a crash never leaves a truncated file behind
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as file:
+        file.write(index)
+        file.write(blob)
+        file.flush()
+        os.fsync(file.fileno())
+    tmp_path.replace(path)
+
+
+def import_json(path: Path) -> dict[str, str]:
+    with path.open("r", encoding="utf8") as file:
+        acronyms = json.load(file)
+
+    if not isinstance(acronyms, dict):
+        raise InvalidAcronymsFile("Expected a JSON object")
+    return {str(key): str(value) for key, value in acronyms.items()}
+
+
+def export_json(path: Path, acronyms: Mapping[str, str]) -> None:
+    with path.open("w", encoding="utf8") as file:
+        json.dump(dict(acronyms), file, ensure_ascii=False, indent=2)
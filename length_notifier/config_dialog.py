@@ -47,7 +47,7 @@ class LengthNotifierConfigDialog(SettingsDialog):
                 callback=self._on_setting,
                 data="MESSAGE_WARNING_LENGTH",
                 desc=_("Message length at which the highlight is shown"),
-                props={"range_": (1, 1000, 1)},
+                props={"range_": (1, 100000, 1)},
             ),
             Setting(
                 SettingKind.COLOR,
@@ -70,6 +70,30 @@ class LengthNotifierConfigDialog(SettingsDialog):
                     "only (comma separated)"
                 ),
             ),
+            Setting(
+                SettingKind.SWITCH,
+                _("Count Bytes"),
+                SettingType.VALUE,
+                self.plugin.config["COUNT_BYTES"],
+                callback=self._on_setting,
+                data="COUNT_BYTES",
+                desc=_(
+                    "Count the UTF-8 encoded size in bytes instead of characters, "
+                    "servers limit the size of messages in bytes"
+                ),
+            ),
+            Setting(
+                SettingKind.SWITCH,
+                _("Include Encryption"),
+                SettingType.VALUE,
+                self.plugin.config["ENCRYPTION_OVERHEAD"],
+                callback=self._on_setting,
+                data="ENCRYPTION_OVERHEAD",
+                desc=_(
+                    "Add the estimated overhead of the chat encryption "
+                    "when counting bytes"
+                ),
+            ),
         ]
 
         SettingsDialog.__init__(
@@ -30,6 +30,7 @@ import logging
 from functools import partial
 
 from gi.repository import Gdk
+from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gtk
 from nbxmpp.protocol import JID
@@ -46,6 +47,22 @@ from length_notifier.config_dialog import LengthNotifierConfigDialog
 
 log = logging.getLogger("gajim.p.length_notifier")
 
+# Estimated size in bytes of the encryption elements added to a message,
+# assuming a few recipient devices or keys
+ENCRYPTION_OVERHEAD = {
+    "OMEMO": 600,
+    "OpenPGP": 900,
+    "PGP": 600,
+}
+
+
+def estimate_encrypted_size(size: int, encryption: str | None) -> int:
+    overhead = ENCRYPTION_OVERHEAD.get(encryption or "")
+    if overhead is None:
+        return size
+    # The ciphertext is base64 encoded
+    return (size + 2) // 3 * 4 + overhead
+
 
 class LengthNotifierPlugin(GajimPlugin):
     def init(self) -> None:
@@ -74,6 +91,14 @@ class LengthNotifierPlugin(GajimPlugin):
                 "",
                 "Enable the plugin for selected XMPP addresses only (comma separated)",
             ),
+            "COUNT_BYTES": (
+                False,
+                "Count the UTF-8 encoded size in bytes instead of characters",
+            ),
+            "ENCRYPTION_OVERHEAD": (
+                False,
+                "Add the estimated overhead of the chat encryption to the size",
+            ),
         }
 
         self._message_action_box = None
@@ -122,33 +147,57 @@ class Counter(Gtk.Label):
     def __init__(
         self, message_input: MessageInputTextView, config: GajimPluginConfig
     ) -> None:
-        Gtk.Label.__init__(self)
-        self.set_tooltip_text(_("Number of typed characters"))
+        Gtk.Label.__init__(self, label="0")
         self.add_css_class("dim-label")
 
         self._config = config
 
         self._contact = None
+        self._enabled = False
+
+        # Parsed from the JIDS setting, None if not restricted
+        self._allowed_jids: set[JID] | None = None
+        self._allowed_domains: set[str] = set()
+
+        # Last shown state, so the label and CSS are only touched on change
+        self._count = 0
+        self._warning = False
+        self._tick_id: int | None = None
 
         self._max_length = None
         self._color = None
         self._inverted_color = None
 
+        # UTF-8 size of the tracked buffer, kept up to date
+        # from the inserted and deleted text
+        self._count_bytes = False
+        self._add_encryption_overhead = False
+        self._buffer: Gtk.TextBuffer | None = None
+        self._buffer_signal_ids: list[int] = []
+        self._byte_count = 0
+
         self._provider = Gtk.CssProvider()
         self._textview = message_input
 
         context = self._textview.get_style_context()
         context.add_provider(self._provider, Gtk.STYLE_PROVIDER_PRIORITY_USER)
 
-        self._signal_id = self._textview.connect("buffer-changed", self._update)
+        self._signal_id = self._textview.connect(
+            "buffer-changed", self._on_buffer_changed
+        )
 
         self._parse_config()
         self._set_css()
 
     def do_unroot(self) -> None:
+        if self._tick_id is not None:
+            self.remove_tick_callback(self._tick_id)
+            self._tick_id = None
+
         if GObject.signal_handler_is_connected(self._textview, self._signal_id):
             self._textview.disconnect(self._signal_id)
 
+        self._untrack_buffer()
         self._textview.get_style_context().remove_provider(self._provider)
 
         del self._config
@@ -167,6 +216,44 @@ class Counter(Gtk.Label):
         blue = int(255 - rgba.blue * 255)
         self._inverted_color = f"rgb({red}, {green}, {blue})"
 
+        self._count_bytes = cast(bool, self._config["COUNT_BYTES"])
+        self._add_encryption_overhead = cast(bool, self._config["ENCRYPTION_OVERHEAD"])
+        if not self._count_bytes:
+            self.set_tooltip_text(_("Number of typed characters"))
+            self._untrack_buffer()
+        elif self._add_encryption_overhead:
+            self.set_tooltip_text(_("Estimated size of the encrypted message in bytes"))
+        else:
+            self.set_tooltip_text(_("Size of the message in bytes"))
+
+        self._parse_allowed_jids()
+
+    def _parse_allowed_jids(self) -> None:
+        jids: list[str] | str = self._config["JIDS"]  # type: ignore
+
+        self._allowed_domains = set()
+        if not jids:
+            # Not restricted to any JIDs
+            self._allowed_jids = None
+            return
+
+        # Check for both current and legacy settings format
+        if isinstance(jids, list):
+            allowed_jids = jids
+        else:
+            allowed_jids = jids.split(",")
+
+        self._allowed_jids = set()
+        for allowed_jid in allowed_jids:
+            try:
+                address = JID.from_string(allowed_jid.strip())
+            except Exception as error:
+                log.error("Error parsing JID: %s (%s)", error, allowed_jid)
+                continue
+            if address.is_domain:
+                self._allowed_domains.add(address.domain)
+            self._allowed_jids.add(address)
+
     def _set_css(self) -> None:
         css = """
         .length-warning {
@@ -181,71 +268,127 @@ class Counter(Gtk.Label):
         self._provider.load_from_string(css)
 
     def _set_count(self, count: int) -> None:
+        if count == self._count:
+            return
+        self._count = count
         self.set_label(str(count))
 
-    def _update(self, *args: Any) -> bool:
+    def _set_warning(self, warning: bool) -> None:
+        if warning == self._warning:
+            return
+        self._warning = warning
+        if warning:
+            self._textview.add_css_class("length-warning")
+        else:
+            self._textview.remove_css_class("length-warning")
+
+    def _on_buffer_changed(self, *args: Any) -> None:
+        # Several changes within one frame, e.g. while pasting or
+        # replacing text, result in a single update
+        if self._tick_id is None:
+            self._tick_id = self.add_tick_callback(self._on_tick)
+
+    def _on_tick(self, _widget: Gtk.Widget, _frame_clock: Gdk.FrameClock) -> bool:
+        self._tick_id = None
+        self._update()
+        return GLib.SOURCE_REMOVE
+
+    def _update(self) -> None:
         if self._contact is None:
-            return False
+            return
 
-        enable = self._jid_allowed(self._contact.jid)
-        if enable:
-            self.show()
+        if not self._enabled:
+            self._set_count(0)
+            self._set_warning(False)
+            return
+
+        if self._count_bytes:
+            self._track_buffer()
+            count = self._byte_count
+            if self._add_encryption_overhead:
+                assert self._contact is not None
+                encryption = self._contact.settings.get("encryption")
+                count = estimate_encrypted_size(count, encryption)
         else:
-            self.hide()
+            # Counted by the buffer, without copying the text
+            count = self._textview.get_buffer().get_char_count()
 
         assert self._max_length is not None
-        if self._textview.has_text and enable:
-            text = self._textview.get_text()
-            len_text = len(text)
-            self._set_count(len_text)
-            if len_text > self._max_length:
-                self._textview.add_css_class("length-warning")
-            else:
-                self._textview.remove_css_class("length-warning")
-        else:
-            self._set_count(0)
-            self._textview.remove_css_class("length-warning")
+        self._set_count(count)
+        self._set_warning(count > self._max_length)
+
+    def _track_buffer(self) -> None:
+        buffer_ = self._textview.get_buffer()
+        if buffer_ is self._buffer:
+            return
+
+        # The message input uses a buffer per chat, the full text
+        # is only encoded once when a buffer is tracked
+        self._untrack_buffer()
+        self._buffer = buffer_
+        start, end = buffer_.get_bounds()
+        self._byte_count = len(buffer_.get_slice(start, end, True).encode())
+        self._buffer_signal_ids = [
+            buffer_.connect("insert-text", self._on_insert_text),
+            buffer_.connect("delete-range", self._on_delete_range),
+        ]
+
+    def _untrack_buffer(self) -> None:
+        if self._buffer is None:
+            return
+
+        for signal_id in self._buffer_signal_ids:
+            if GObject.signal_handler_is_connected(self._buffer, signal_id):
+                self._buffer.disconnect(signal_id)
+        self._buffer_signal_ids = []
+        self._buffer = None
+        self._byte_count = 0
+
+    def _on_insert_text(
+        self, _buffer: Gtk.TextBuffer, _location: Gtk.TextIter, text: str, _length: int
+    ) -> None:
+        self._byte_count += len(text.encode())
 
-        return False
+    def _on_delete_range(
+        self, buffer_: Gtk.TextBuffer, start: Gtk.TextIter, end: Gtk.TextIter
+    ) -> None:
+        # Connected before the default handler, the text is still there
+        self._byte_count -= len(buffer_.get_slice(start, end, True).encode())
 
     def _jid_allowed(self, current_jid: JID) -> bool:
-        jids: list[str] | str = self._config["JIDS"]  # type: ignore
+        if self._allowed_jids is None:
+            return True
 
-        if not jids:
-            # Not restricted to any JIDs
+        if current_jid.domain in self._allowed_domains:
+            log.debug("Show counter for Domain %s", current_jid.domain)
             return True
+        if current_jid in self._allowed_jids:
+            log.debug("Show counter for JID %s", current_jid)
+            return True
+        return False
 
-        # Check for both current and legacy settings format
-        if isinstance(jids, list):
-            allowed_jids = jids
-        else:
-            allowed_jids = jids.split(",")
+    def _update_enabled(self) -> None:
+        # Evaluated once per contact and config change,
+        # not on every keystroke
+        if self._contact is None:
+            self._enabled = False
+            return
 
-        for allowed_jid in allowed_jids:
-            try:
-                address = JID.from_string(allowed_jid.strip())
-            except Exception as error:
-                log.error("Error parsing JID: %s (%s)", error, allowed_jid)
-                continue
-            if address.is_domain:
-                if current_jid.domain == address:
-                    log.debug("Show counter for Domain %s", address)
-                    return True
-            if current_jid == address:
-                log.debug("Show counter for JID %s", address)
-                return True
-        return False
+        self._enabled = self._jid_allowed(self._contact.jid)
+        self.set_visible(self._enabled)
 
     def update_config(self, config: GajimPluginConfig) -> None:
         self._config = config
         self.reset()
+        self._update_enabled()
         self._update()
 
     def update_contact(self, contact: types.ChatContactT) -> None:
         self._contact = contact
+        self._update_enabled()
         self._update()
 
     def reset(self) -> None:
-        self._textview.remove_css_class("length-warning")
+        self._set_warning(False)
         self._parse_config()
         self._set_css()
@@ -0,0 +1,238 @@
+# This file is part of the PGP Gajim Plugin.
+#
+# PGP Gajim Plugin is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; version 3 only.
+#
+# PGP Gajim Plugin is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PGP Gajim Plugin. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from typing import Any
+from typing import NamedTuple
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+
+# Files whose modification invalidates cached key metadata. Trust changes
+# are written to trustdb.gpg, key additions and removals to the pubring,
+# which is public-keys.d/pubring.db if keyboxd is used (GnuPG >= 2.4).
+KEYRING_FILES = (
+    "pubring.kbx",
+    "pubring.gpg",
+    "public-keys.d/pubring.db",
+    "trustdb.gpg",
+)
+
+
+def get_gnupg_home() -> Path:
+    if home := os.environ.get("GNUPGHOME"):
+        return Path(home)
+    if os.name == "nt":
+        return Path(os.environ.get("APPDATA", "")) / "gnupg"
+    return Path.home() / ".gnupg"
+
+
+@dataclass(frozen=True)
+class KeyMetadata:
+    fingerprint: str
+    keyid: str
+    uids: tuple[str, ...]
+    trust: str
+
+    @classmethod
+    def from_key(cls, key: dict[str, Any]) -> KeyMetadata:
+        return cls(
+            fingerprint=key["fingerprint"],
+            keyid=key["keyid"],
+            uids=tuple(key["uids"]),
+            trust=key["trust"],
+        )
+
+    def matches(self, key_id: str) -> bool:
+        key_id = key_id.upper().removeprefix("0X")
+        return self.fingerprint.upper().endswith(key_id)
+
+
+class KeyCache:
+    """
+    Lazily populated key metadata, dropped whenever one of the
+    keyring files changes on disk
+    """
+
+    def __init__(
+        self,
+        list_keys_func: Callable[[str], list[dict[str, Any]]],
+        gnupg_home: Path | None = None,
+    ) -> None:
+        self._list_keys_func = list_keys_func
+        self._gnupg_home = gnupg_home or get_gnupg_home()
+        self._keyring_state: tuple[int, ...] | None = None
+        self._keys: dict[str, KeyMetadata] = {}
+        # Encryption may run in worker threads
+        self._lock = threading.Lock()
+
+    def _get_keyring_state(self) -> tuple[int, ...]:
+        state: list[int] = []
+        for filename in KEYRING_FILES:
+            try:
+                state.append((self._gnupg_home / filename).stat().st_mtime_ns)
+            except OSError:
+                state.append(0)
+        return tuple(state)
+
+    def _validate(self) -> None:
+        state = self._get_keyring_state()
+        if state != self._keyring_state:
+            self._keys.clear()
+            self._keyring_state = state
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._keys.clear()
+            self._keyring_state = None
+
+    def get(self, key_id: str) -> list[KeyMetadata]:
+        with self._lock:
+            return self._get(key_id)
+
+    def _get(self, key_id: str) -> list[KeyMetadata]:
+        self._validate()
+
+        if key := self._keys.get(key_id.upper()):
+            return [key]
+
+        keys = [key for key in self._keys.values() if key.matches(key_id)]
+        if keys:
+            return keys
+
+        keys = [KeyMetadata.from_key(key) for key in self._list_keys_func(key_id)]
+        for key in keys:
+            self._keys[key.fingerprint.upper()] = key
+        return keys
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class LRUCache[K, V]:
+    """
+    Bounded least recently used cache which counts hits and misses
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._maxsize = maxsize
+        self._items: OrderedDict[K, V] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: K) -> V | None:
+        value = self._items.get(key)
+        if value is None:
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        self._items[key] = value
+        self._items.move_to_end(key)
+        self._shrink()
+
+    def resize(self, maxsize: int) -> None:
+        self._maxsize = maxsize
+        self._shrink()
+
+    def _shrink(self) -> None:
+        while len(self._items) > max(self._maxsize, 0):
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self._hits, self._misses, self._maxsize, len(self._items))
+
+
+class SignatureCache(LRUCache[tuple[str, str], str]):
+    """
+    Detached signatures keyed by key id and signed payload
+    """
+
+
+class SignatureService:
+    """
+    Signs payloads for all accounts. Signatures are cached by key
+    fingerprint and payload, and concurrent requests for the same input
+    wait for the one signing operation already in flight.
+    """
+
+    def __init__(self, sign_func: Callable[[str, str], str], maxsize: int) -> None:
+        self._sign_func = sign_func
+        self._cache = SignatureCache(maxsize)
+        self._in_flight: dict[tuple[str, str], Future[str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self) -> SignatureCache:
+        return self._cache
+
+    def sign(self, payload: str, key_id: str) -> str:
+        key = (key_id, payload)
+        with self._lock:
+            signature = self._cache.get(key)
+            if signature is not None:
+                return signature
+
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._in_flight[key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            return future.result()
+
+        try:
+            signature = self._sign_func(payload, key_id)
+        except Exception as error:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(error)
+            raise
+
+        with self._lock:
+            self._cache.set(key, signature)
+            del self._in_flight[key]
+        future.set_result(signature)
+        return signature
+
+
+class DecryptionCache(LRUCache[bytes, str]):
+    """
+    Plaintexts keyed by a digest of the ciphertext. Held in memory only,
+    plaintext must never be written to disk.
+    """
+
+    @staticmethod
+    def get_digest(payload: str) -> bytes:
+        return hashlib.sha256(payload.encode()).digest()
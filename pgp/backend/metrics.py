@@ -0,0 +1,134 @@
+# This file is part of the PGP Gajim Plugin.
+#
+# PGP Gajim Plugin is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; version 3 only.
+#
+# PGP Gajim Plugin is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PGP Gajim Plugin. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from typing import Any
+from typing import Concatenate
+
+import bisect
+import functools
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from dataclasses import field
+
+# Upper bounds of the latency histogram buckets in milliseconds,
+# the last bucket counts everything above
+LATENCY_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+@dataclass
+class OperationStats:
+    calls: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    total_time: float = 0
+    max_time: float = 0
+    histogram: list[int] = field(
+        default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1)
+    )
+
+    @property
+    def average_time(self) -> float:
+        if not self.calls:
+            return 0
+        return self.total_time / self.calls
+
+    def copy(self) -> OperationStats:
+        return OperationStats(
+            self.calls,
+            self.errors,
+            self.in_flight,
+            self.total_time,
+            self.max_time,
+            list(self.histogram),
+        )
+
+
+class Metrics:
+    """
+    Call counts, errors, in-flight operations and latency histograms
+    of backend operations. Operations may run in worker threads.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats: dict[str, OperationStats] = {}
+
+    def _get_stats(self, name: str) -> OperationStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = OperationStats()
+        return stats
+
+    def start(self, name: str) -> float:
+        with self._lock:
+            self._get_stats(name).in_flight += 1
+        return time.monotonic()
+
+    def stop(self, name: str, start_time: float, failed: bool = False) -> None:
+        elapsed = time.monotonic() - start_time
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, elapsed * 1000)
+        with self._lock:
+            stats = self._get_stats(name)
+            stats.in_flight -= 1
+            stats.calls += 1
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+            stats.histogram[bucket] += 1
+            if failed:
+                stats.errors += 1
+
+    def add_error(self, name: str) -> None:
+        with self._lock:
+            self._get_stats(name).errors += 1
+
+    def snapshot(self) -> dict[str, OperationStats]:
+        with self._lock:
+            return {name: stats.copy() for name, stats in self._stats.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            for name, stats in self._stats.items():
+                self._stats[name] = OperationStats(in_flight=stats.in_flight)
+
+
+def instrumented[**P, R](
+    name: str,
+) -> Callable[[Callable[Concatenate[Any, P], R]], Callable[Concatenate[Any, P], R]]:
+    """
+    Record every call of the decorated method in the metrics of its
+    instance. Raised exceptions are counted as errors.
+    """
+
+    def decorator(
+        func: Callable[Concatenate[Any, P], R],
+    ) -> Callable[Concatenate[Any, P], R]:
+        @functools.wraps(func)
+        def wrapper(self: Any, *args: P.args, **kwargs: P.kwargs) -> R:
+            metrics: Metrics = self.metrics
+            start_time = metrics.start(name)
+            failed = True
+            try:
+                result = func(self, *args, **kwargs)
+                failed = False
+                return result
+            finally:
+                metrics.stop(name, start_time, failed)
+
+        return wrapper
+
+    return decorator
@@ -20,14 +20,23 @@
 # You should have received a copy of the GNU General Public License
 # along with PGP Gajim Plugin. If not, see <http://www.gnu.org/licenses/>.
 
+from typing import Any
+
 import logging
 import os
-from functools import lru_cache
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 
 import gnupg
 
 from gajim.common.util.classes import Singleton
 
+from pgp.backend.cache import DecryptionCache
+from pgp.backend.cache import KeyCache
+from pgp.backend.cache import KeyMetadata
+from pgp.backend.cache import SignatureService
+from pgp.backend.metrics import instrumented
+from pgp.backend.metrics import Metrics
 from pgp.exceptions import SignError
 
 logger = logging.getLogger("gajim.p.pgplegacy")
@@ -37,20 +46,45 @@ if logger.getEffectiveLevel() == logging.DEBUG:
     logger.setLevel(logging.DEBUG)
 
 
+ENCRYPT_WORKERS = 4
+DECRYPTION_CACHE_SIZE = 256
+SIGNATURE_CACHE_SIZE = 32
+
+
 class PGP(metaclass=Singleton):
-    def __init__(self) -> None:
-        self._pgp = gnupg.GPG(use_agent=True)
+    def __init__(self, binary: str = "gpg") -> None:
+        self._pgp = gnupg.GPG(gpgbinary=binary, use_agent=True)
         self._pgp.decode_errors = "replace"
+        self._metrics = Metrics()
+        self._key_cache = KeyCache(self._list_key_data)
+        self._decryption_cache = DecryptionCache(DECRYPTION_CACHE_SIZE)
+        self._signature_service = SignatureService(self.sign, SIGNATURE_CACHE_SIZE)
+        self._executor = ThreadPoolExecutor(
+            max_workers=ENCRYPT_WORKERS, thread_name_prefix="pgp"
+        )
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    @property
+    def decryption_cache(self) -> DecryptionCache:
+        return self._decryption_cache
 
+    @property
+    def signature_service(self) -> SignatureService:
+        return self._signature_service
+
+    @instrumented("encrypt")
     def encrypt(
         self, data: str, recipients: list[str], always_trust: bool = False
     ) -> tuple[str, str]:
         if not always_trust:
             # check that we'll be able to encrypt
-            result = self.get_key(recipients[0])
-            for key in result:
-                if key["trust"] not in ("f", "u"):
-                    return "", "NOT_TRUSTED " + key["keyid"][-8:]
+            for recipient in recipients:
+                for key in self.get_key_metadata(recipient):
+                    if key.trust not in ("f", "u"):
+                        return "", "NOT_TRUSTED " + key.keyid[-8:]
 
         result = self._pgp.encrypt(
             data.encode("utf8"), recipients, always_trust=always_trust
@@ -60,15 +94,39 @@ class PGP(metaclass=Singleton):
             error = ""
         else:
             error = result.status or "Unknown"
+            self._metrics.add_error("encrypt")
 
         return self._strip_header_footer(str(result)), error
 
+    def encrypt_async(
+        self, data: str, recipients: list[str], always_trust: bool = False
+    ) -> Future[tuple[str, str]]:
+        return self._executor.submit(self.encrypt, data, recipients, always_trust)
+
     def decrypt(self, payload: str) -> str:
+        # The same ciphertext arrives again via carbons, MAM and
+        # duplicate delivery, serve these without running gpg
+        digest = DecryptionCache.get_digest(payload)
+        plaintext = self._decryption_cache.get(digest)
+        if plaintext is not None:
+            return plaintext
+
         data = self._add_header_footer(payload, "MESSAGE")
-        result = self._pgp.decrypt(data.encode("utf8"))
-        return str(result)
+        result = self._decrypt(data)
+        plaintext = str(result)
+        if result.ok:
+            self._decryption_cache.set(digest, plaintext)
+        else:
+            self._metrics.add_error("decrypt")
+        return plaintext
+
+    @instrumented("decrypt")
+    def _decrypt(self, data: str) -> gnupg.Crypt:
+        # Only calls to gpg are measured, cache hits are
+        # counted by the decryption cache
+        return self._pgp.decrypt(data.encode("utf8"))
 
-    @lru_cache(maxsize=8)  # noqa: B019
+    @instrumented("sign")
     def sign(self, payload: str | None, key_id: str) -> str:
         if payload is None:
             payload = ""
@@ -78,6 +136,7 @@ class PGP(metaclass=Singleton):
             return self._strip_header_footer(str(result))
         raise SignError(result.status)
 
+    @instrumented("verify")
     def verify(self, payload: str | None, signed: str) -> str | None:
         # Hash algorithm is not transferred in the signed
         # presence stanza so try all algorithms.
@@ -104,6 +163,17 @@ class PGP(metaclass=Singleton):
     def get_key(self, key_id: str) -> gnupg.ListKeys:
         return self._pgp.list_keys(keys=[key_id])
 
+    @instrumented("list_keys")
+    def _list_key_data(self, key_id: str) -> list[dict[str, Any]]:
+        return list(self._pgp.list_keys(keys=[key_id]))
+
+    def get_key_metadata(self, key_id: str) -> list[KeyMetadata]:
+        return self._key_cache.get(key_id)
+
+    def invalidate_key_cache(self) -> None:
+        self._key_cache.invalidate()
+
+    @instrumented("list_keys")
     def get_keys(self, secret: bool = False) -> dict[str, str]:
         keys: dict[str, str] = {}
         result = self._pgp.list_keys(secret=secret)
@@ -113,6 +183,14 @@ class PGP(metaclass=Singleton):
             keys[key["fingerprint"]] = next(uid for uid in key["uids"] if uid)
         return keys
 
+    @instrumented("list_keys")
+    def get_key_uids(self, secret: bool = False) -> dict[str, list[str]]:
+        result = self._pgp.list_keys(secret=secret)
+        return {
+            key["fingerprint"]: [uid for uid in key["uids"] if uid] for key in result
+        }
+
+    @instrumented("list_keys")
     def list_keys(
         self, secret: bool = False, keys: list[str] | None = None, sigs: bool = False
     ) -> list[str]:
@@ -126,28 +204,41 @@ class PGP(metaclass=Singleton):
         """
         if not data:
             return ""
-        lines = data.splitlines()
-        while lines[0] != "":
-            lines.remove(lines[0])
-        while lines[0] == "":
-            lines.remove(lines[0])
-        i = 0
-        for line in lines:
-            if line:
-                if line[0] == "-":
-                    break
-            i = i + 1
-        line = "\n".join(lines[0:i])
-        return line
+        # Armored data is ASCII, so CRLF is the only other line break
+        text = data.replace("\r\n", "\n") if "\r" in data else data
+        length = len(text)
+
+        # Skip the armor header lines up to the first empty line
+        if text.startswith("\n"):
+            start = 0
+        else:
+            start = text.find("\n\n")
+            if start == -1:
+                return ""
+            start += 1
+        while start < length and text[start] == "\n":
+            start += 1
+
+        # The body ends before the first line starting with "-"
+        if text.startswith("-", start):
+            return ""
+        end = text.find("\n-", start)
+        if end == -1:
+            end = length - 1 if text.endswith("\n") else length
+        return text[start:end]
 
     @staticmethod
     def _add_header_footer(data: str, type_: str) -> str:
         """
         Add header and footer from data
         """
-        out = "-----BEGIN PGP %s-----" % type_ + os.linesep
-        out = out + "Version: PGP" + os.linesep
-        out = out + os.linesep
-        out = out + data + os.linesep
-        out = out + "-----END PGP %s-----" % type_ + os.linesep
-        return out
+        return os.linesep.join(
+            [
+                "-----BEGIN PGP %s-----" % type_,
+                "Version: PGP",
+                "",
+                data,
+                "-----END PGP %s-----" % type_,
+                "",
+            ]
+        )
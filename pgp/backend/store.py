@@ -20,14 +20,36 @@ from typing import Any
 
 import json
 import logging
+import sqlite3
 from collections.abc import Callable
+from collections.abc import Iterator
+from contextlib import contextmanager
 from pathlib import Path
 
 from nbxmpp import JID
 
+from gajim.common import app
 from gajim.common import configpaths
 
-CURRENT_STORE_VERSION = 3
+CURRENT_STORE_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS own_key (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    key_id TEXT NOT NULL,
+    key_user TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contact_keys (
+    account TEXT NOT NULL,
+    jid TEXT NOT NULL,
+    key_id TEXT NOT NULL,
+    key_user TEXT NOT NULL,
+    PRIMARY KEY (account, jid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS json_migrated (
+    account TEXT PRIMARY KEY
+) WITHOUT ROWID;
+"""
 
 
 class KeyResolveError(Exception):
@@ -35,6 +57,15 @@ class KeyResolveError(Exception):
 
 
 class KeyStore:
+    """
+    SQLite backed key bindings. Lookups are point queries, so the store
+    is never loaded as a whole. The v3 JSON store is migrated on first use
+    of each account, it may be shared by accounts with the same JID.
+
+    Nothing is read or created on disk until the store is first used,
+    and reading never creates it.
+    """
+
     def __init__(
         self,
         account: str,
@@ -45,42 +76,119 @@ class KeyStore:
         self._list_keys_func = list_keys_func
         self._log = log
         self._account = account
+        self._transaction_depth = 0
 
         own_bare_jid = own_jid.bare
-        path = Path(configpaths.get("PLUGINS_DATA")) / "pgplegacy" / own_bare_jid
-        if not path.exists():
-            path.mkdir(parents=True)
-
-        self._store_path = path / "store"
-        if self._store_path.exists():
-            # having store v2 or higher
-            with self._store_path.open("r") as file:
-                try:
-                    self._store = json.load(file)
-                except Exception:
-                    log.exception("Could not load config")
-                    self._store = self._empty_store()
-                    self._save_store()
+        self._path = Path(configpaths.get("PLUGINS_DATA")) / "pgplegacy" / own_bare_jid
+        self._con: sqlite3.Connection | None = None
+        self._own_key_data: dict[str, str] | None = None
 
-        else:
-            # having store v1 or fresh install
-            self._store = self._empty_store()
-            self._save_store()
+    def _open(self, create: bool = False) -> sqlite3.Connection | None:
+        if self._con is not None:
+            return self._con
 
-    @staticmethod
-    def _empty_store() -> dict[str, Any]:
-        return {
-            "_version": CURRENT_STORE_VERSION,
-            "own_key_data": None,
-            "contact_key_data": {},
-        }
+        db_path = self._path / "store.db"
+        json_store_path = self._path / "store"
+        if not create and not db_path.exists() and not json_store_path.exists():
+            return None
+
+        if not self._path.exists():
+            self._path.mkdir(parents=True)
+
+        self._con = sqlite3.connect(db_path)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+
+        version = self._con.execute("PRAGMA user_version").fetchone()[0]
+        if version < CURRENT_STORE_VERSION:
+            with self._con:
+                self._con.executescript(SCHEMA)
+                self._con.execute("PRAGMA user_version=%d" % CURRENT_STORE_VERSION)
+
+        if json_store_path.exists():
+            self._migrate_json_store(self._con, json_store_path)
+
+        self._own_key_data = self._load_own_key_data(self._con)
+        return self._con
+
+    def _migrate_json_store(self, con: sqlite3.Connection, store_path: Path) -> None:
+        # having store v2 or v3
+        row = con.execute(
+            "SELECT 1 FROM json_migrated WHERE account = ?", (self._account,)
+        ).fetchone()
+        if row is not None:
+            return
+
+        try:
+            with store_path.open("r") as file:
+                store = json.load(file)
+        except Exception:
+            self._log.exception("Could not load config")
+            store = {}
+
+        with con:
+            own_key_data = store.get("own_key_data")
+            if own_key_data is not None:
+                con.execute(
+                    "INSERT OR IGNORE INTO own_key VALUES (0, ?, ?)",
+                    (own_key_data["key_id"], own_key_data["key_user"]),
+                )
 
-    def _save_store(self) -> None:
-        with self._store_path.open("w") as file:
-            json.dump(self._store, file)
+            # Keys are "account-jid", account names may contain "-" too,
+            # so only entries with the prefix of this account are taken.
+            # The JSON store is kept for other accounts sharing it.
+            prefix = self._account + "-"
+            other_prefixes = tuple(
+                account + "-"
+                for account in app.settings.get_accounts()
+                if account != self._account and account.startswith(prefix)
+            )
+            rows: list[tuple[str, str, str, str]] = []
+            for dict_key, key_data in store.get("contact_key_data", {}).items():
+                if key_data is None or not dict_key.startswith(prefix):
+                    continue
+                if other_prefixes and dict_key.startswith(other_prefixes):
+                    # Entry of an account whose name starts with ours
+                    continue
+                rows.append(
+                    (
+                        self._account,
+                        dict_key.removeprefix(prefix),
+                        key_data["key_id"],
+                        key_data["key_user"],
+                    )
+                )
+
+            con.executemany(
+                "INSERT OR REPLACE INTO contact_keys VALUES (?, ?, ?, ?)", rows
+            )
+            con.execute("INSERT INTO json_migrated VALUES (?)", (self._account,))
+
+        self._log.info("Migrated %s key bindings to SQLite store", len(rows))
 
-    def _get_dict_key(self, jid: str) -> str:
-        return "%s-%s" % (self._account, jid)
+    def _commit(self) -> None:
+        if self._con is not None and not self._transaction_depth:
+            self._con.commit()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Commit only when the outermost transaction ends,
+        so many key bindings can be changed at once
+        """
+        con = self._open(create=True)
+        assert con is not None
+        self._transaction_depth += 1
+        try:
+            yield
+        except Exception:
+            if self._transaction_depth == 1:
+                con.rollback()
+                self._own_key_data = self._load_own_key_data(con)
+            raise
+        finally:
+            self._transaction_depth -= 1
+        self._commit()
 
     def _resolve_short_id(self, short_id: str, has_secret: bool = False) -> str:
         fingerprints = self._list_keys_func(secret=has_secret, keys=[short_id])
@@ -98,37 +206,52 @@ class KeyStore:
             )
         raise KeyResolveError
 
-    def set_own_key_data(self, key_data: tuple[str, str] | None) -> None:
-        self._set_own_key_data_nosync(key_data)
-        self._save_store()
+    @staticmethod
+    def _load_own_key_data(con: sqlite3.Connection) -> dict[str, str] | None:
+        row = con.execute("SELECT key_id, key_user FROM own_key").fetchone()
+        if row is None:
+            return None
+        return {"key_id": row[0], "key_user": row[1]}
 
-    def _set_own_key_data_nosync(self, key_data: tuple[str, str] | None) -> None:
+    def set_own_key_data(self, key_data: tuple[str, str] | None) -> None:
+        con = self._open(create=True)
+        assert con is not None
         if key_data is None:
-            self._store["own_key_data"] = None
+            con.execute("DELETE FROM own_key")
+            self._own_key_data = None
         else:
-            self._store["own_key_data"] = {
-                "key_id": key_data[0],
-                "key_user": key_data[1],
-            }
+            con.execute("INSERT OR REPLACE INTO own_key VALUES (0, ?, ?)", key_data)
+            self._own_key_data = {"key_id": key_data[0], "key_user": key_data[1]}
+        self._commit()
 
     def get_own_key_data(self) -> dict[str, str] | None:
-        return self._store["own_key_data"]
+        self._open()
+        return self._own_key_data
 
     def get_contact_key_data(self, jid: str) -> dict[str, str] | None:
-        key_ids = self._store["contact_key_data"]
-        dict_key = self._get_dict_key(jid)
-        return key_ids.get(dict_key)
+        con = self._open()
+        if con is None:
+            return None
 
-    def set_contact_key_data(self, jid: str, key_data: tuple[str, str] | None) -> None:
-        self._set_contact_key_data_nosync(jid, key_data)
-        self._save_store()
+        row = con.execute(
+            "SELECT key_id, key_user FROM contact_keys WHERE account = ? AND jid = ?",
+            (self._account, jid),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"key_id": row[0], "key_user": row[1]}
 
-    def _set_contact_key_data_nosync(
-        self, jid: str, key_data: tuple[str, str] | None
-    ) -> None:
-        key_ids = self._store["contact_key_data"]
-        dict_key = self._get_dict_key(jid)
+    def set_contact_key_data(self, jid: str, key_data: tuple[str, str] | None) -> None:
+        con = self._open(create=True)
+        assert con is not None
         if key_data is None:
-            key_ids[dict_key] = None
+            con.execute(
+                "DELETE FROM contact_keys WHERE account = ? AND jid = ?",
+                (self._account, jid),
+            )
         else:
-            key_ids[dict_key] = {"key_id": key_data[0], "key_user": key_data[1]}
+            con.execute(
+                "INSERT OR REPLACE INTO contact_keys VALUES (?, ?, ?, ?)",
+                (self._account, jid, *key_data),
+            )
+        self._commit()
@@ -19,17 +19,20 @@ from __future__ import annotations
 from typing import cast
 from typing import TYPE_CHECKING
 
+from functools import partial
 from pathlib import Path
 
 from gi.repository import GLib
 from gi.repository import Gtk
 
 from gajim.common import app
+from gajim.gtk.alert import InformationAlertDialog
 from gajim.gtk.util.classes import SignalManager
 from gajim.gtk.window import GajimAppWindow
 from gajim.plugins.helpers import get_builder
 from gajim.plugins.plugins_i18n import _
 
+from ..backend.metrics import LATENCY_BUCKETS
 from ..modules.pgp_legacy import PGPLegacy
 from .key import ChooseGPGKeyDialog
 
@@ -66,14 +69,21 @@ class PGPConfigDialog(GajimAppWindow):
 
         self._plugin = plugin
 
+        modules: dict[str, PGPLegacy] = {}
         for account in app.settings.get_active_accounts():
             module = cast(
                 PGPLegacy,
                 app.get_client(account).get_module("PGPLegacy"),  # pyright: ignore
             )
+            modules[account] = module
             page = Page(module)
             self._ui.stack.add_titled(page, account, app.get_account_label(account))
 
+        if modules:
+            self._ui.stack.add_titled(
+                DiagnosticsPage(modules), "diagnostics", _("Diagnostics")
+            )
+
         self.show()
 
     def _cleanup(self) -> None:
@@ -94,14 +104,31 @@ class Page(Gtk.Box, SignalManager):
         self._button.set_margin_top(18)
         self._connect(self._button, "clicked", self._on_assign)
 
+        self._auto_assign_button = Gtk.Button(label=_("Assign Keys to Contacts"))
+        self._auto_assign_button.set_tooltip_text(
+            _("Assign keys to all contacts whose address matches a key")
+        )
+        self._auto_assign_button.set_halign(Gtk.Align.CENTER)
+        self._auto_assign_button.set_margin_top(6)
+        self._connect(self._auto_assign_button, "clicked", self._on_auto_assign)
+
         self._load_key()
         self.append(self._label)
         self.append(self._button)
+        self.append(self._auto_assign_button)
 
     def _on_assign(self, _button: Gtk.Button) -> None:
-        secret_keys = self._module.pgp_backend.get_keys(secret=True)
         ChooseGPGKeyDialog(
-            secret_keys, cast(Gtk.Window, self.get_root()), self._on_response
+            partial(self._module.pgp_backend.get_keys, secret=True),
+            cast(Gtk.Window, self.get_root()),
+            self._on_response,
+        )
+
+    def _on_auto_assign(self, _button: Gtk.Button) -> None:
+        count = self._module.auto_assign_keys()
+        InformationAlertDialog(
+            _("Keys Assigned"),
+            _("Keys have been assigned to %s contacts.") % count,
         )
 
     def _load_key(self) -> None:
@@ -133,3 +160,92 @@ class Page(Gtk.Box, SignalManager):
         self._disconnect_all()
         del self._module
         app.check_finalize(self)
+
+
+class DiagnosticsPage(Gtk.Box, SignalManager):
+    def __init__(self, modules: dict[str, PGPLegacy]) -> None:
+        SignalManager.__init__(self)
+        Gtk.Box.__init__(self, orientation=Gtk.Orientation.VERTICAL, spacing=12)
+
+        self._modules = modules
+
+        self._grid = Gtk.Grid(row_spacing=6, column_spacing=12)
+        self.append(self._grid)
+
+        self._cache_label = Gtk.Label(xalign=0, selectable=True)
+        self.append(self._cache_label)
+
+        reset_button = Gtk.Button(label=_("Reset"))
+        reset_button.set_halign(Gtk.Align.END)
+        self._connect(reset_button, "clicked", self._on_reset)
+        self.append(reset_button)
+
+        self._update()
+        self._timeout_id = GLib.timeout_add_seconds(1, self._update)
+
+    def _get_module(self) -> PGPLegacy:
+        # The backend and its metrics are shared by all accounts
+        return next(iter(self._modules.values()))
+
+    def _update(self) -> bool:
+        while child := self._grid.get_first_child():
+            self._grid.remove(child)
+
+        headers = [
+            _("Operation"),
+            _("Calls"),
+            _("Errors"),
+            _("In Flight"),
+            _("Average (ms)"),
+            _("Max (ms)"),
+        ]
+        for column, header in enumerate(headers):
+            label = Gtk.Label(label=header, xalign=0)
+            label.add_css_class("bold")
+            self._grid.attach(label, column, 0, 1, 1)
+
+        metrics = self._get_module().get_backend_metrics()
+        for row, (name, stats) in enumerate(sorted(metrics.items()), start=1):
+            values = [
+                name,
+                str(stats.calls),
+                str(stats.errors),
+                str(stats.in_flight),
+                "%.1f" % (stats.average_time * 1000),
+                "%.1f" % (stats.max_time * 1000),
+            ]
+            for column, value in enumerate(values):
+                label = Gtk.Label(label=value, xalign=0)
+                label.set_tooltip_text(self._format_histogram(stats.histogram))
+                self._grid.attach(label, column, row, 1, 1)
+
+        backend = self._get_module().pgp_backend
+        decryption_info = backend.decryption_cache.cache_info()
+        signature_info = backend.signature_service.cache.cache_info()
+        lines = [
+            _("Decryption cache: %(hits)s hits, %(misses)s misses")
+            % {"hits": decryption_info.hits, "misses": decryption_info.misses},
+            _("Signature cache: %(hits)s hits, %(misses)s misses")
+            % {"hits": signature_info.hits, "misses": signature_info.misses},
+        ]
+        self._cache_label.set_text("\n".join(lines))
+        return GLib.SOURCE_CONTINUE
+
+    @staticmethod
+    def _format_histogram(histogram: list[int]) -> str:
+        lines: list[str] = []
+        for bound, count in zip(LATENCY_BUCKETS, histogram, strict=False):
+            lines.append("≤ %s ms: %s" % (bound, count))
+        lines.append("> %s ms: %s" % (LATENCY_BUCKETS[-1], histogram[-1]))
+        return "\n".join(lines)
+
+    def _on_reset(self, _button: Gtk.Button) -> None:
+        self._get_module().pgp_backend.metrics.reset()
+        self._update()
+
+    def do_unroot(self) -> None:
+        GLib.source_remove(self._timeout_id)
+        Gtk.Box.do_unroot(self)
+        self._disconnect_all()
+        del self._modules
+        app.check_finalize(self)
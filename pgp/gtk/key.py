@@ -16,15 +16,19 @@
 
 from __future__ import annotations
 
-from typing import Any
 from typing import cast
 from typing import TYPE_CHECKING
 
+import logging
+import threading
 from collections.abc import Callable
 from pathlib import Path
 
+from gi.repository import Gio
 from gi.repository import GLib
+from gi.repository import GObject
 from gi.repository import Gtk
+from gi.repository import Pango
 from nbxmpp import JID
 
 from gajim.common import app
@@ -38,10 +42,18 @@ if TYPE_CHECKING:
     from ..plugin import PGPPlugin
 
 
+log = logging.getLogger("gajim.p.pgplegacy")
+
+LOAD_CHUNK_SIZE = 500
+
+
 class ChooseKeyBuilder(Gtk.Builder):
-    liststore: Gtk.ListStore
     box: Gtk.Box
-    keys_treeview: Gtk.TreeView
+    search_entry: Gtk.SearchEntry
+    keys_view: Gtk.ColumnView
+    button_box: Gtk.Box
+    spinner: Gtk.Spinner
+    error_label: Gtk.Label
     cancel_button: Gtk.Button
     ok_button: Gtk.Button
 
@@ -92,7 +104,7 @@ class KeyDialog(GajimAppWindow):
         del self._module
 
     def _choose_key(self, _button: Gtk.Button) -> None:
-        ChooseGPGKeyDialog(self._module.pgp_backend.get_keys(), self, self._on_response)
+        ChooseGPGKeyDialog(self._module.pgp_backend.get_keys, self, self._on_response)
 
     def _load_key(self) -> None:
         key_data = self._module.get_contact_key_data(self._jid)
@@ -120,10 +132,22 @@ class KeyDialog(GajimAppWindow):
             )
 
 
+class KeyItem(GObject.Object):
+    key_id = GObject.Property(type=str, default="")
+    key_user = GObject.Property(type=str, default="")
+    search_text = GObject.Property(type=str, default="")
+
+    def __init__(self, key_id: str, key_user: str) -> None:
+        GObject.Object.__init__(self)
+        self.key_id = key_id
+        self.key_user = key_user
+        self.search_text = f"{key_id} {key_user}".casefold()
+
+
 class ChooseGPGKeyDialog(GajimAppWindow):
     def __init__(
         self,
-        secret_keys: dict[str, str],
+        get_keys_func: Callable[[], dict[str, str]],
         transient: Gtk.Window,
         callback: Callable[[tuple[str, str] | None], None],
     ) -> None:
@@ -139,47 +163,120 @@ class ChooseGPGKeyDialog(GajimAppWindow):
             header_bar=True,
         )
 
-        secret_keys[_("None")] = _("None")
-
         self.set_resizable(True)
 
         self._callback = callback
         self._selected_key = None
+        self._loading_cancelled = False
 
         ui_path = Path(__file__).parent
         self._ui = cast(
             ChooseKeyBuilder, get_builder(str(ui_path.resolve() / "choose_key.ui"))
         )
 
-        self._connect(self._ui.cancel_button, "clicked", self._on_cancel)
-        self._connect(self._ui.ok_button, "clicked", self._on_ok)
-        self._connect(self._ui.keys_treeview, "cursor-changed", self._on_row_changed)
+        self._model = Gio.ListStore(item_type=KeyItem)
+        self._model.append(KeyItem(_("None"), _("None")))
+
+        # Filtering runs in C on the precomputed search text, incrementally
+        # so the view stays responsive while typing in large keyrings
+        expression = Gtk.PropertyExpression.new(KeyItem, None, "search-text")
+        self._filter = Gtk.StringFilter(
+            expression=expression,
+            ignore_case=False,
+            match_mode=Gtk.StringFilterMatchMode.SUBSTRING,
+        )
+        filter_model = Gtk.FilterListModel(model=self._model, filter=self._filter)
+        filter_model.set_incremental(True)
 
-        model = cast(Gtk.ListStore, self._ui.keys_treeview.get_model())
-        model.set_sort_func(1, self._sort)
+        self._selection = Gtk.SingleSelection(model=filter_model, autoselect=False)
+        self._ui.keys_view.set_model(self._selection)
+        self._add_column(_("Key ID"), self._on_bind_key_id)
+        self._add_column(_("Contact Name"), self._on_bind_key_user)
 
-        for key_id, key_label in secret_keys.items():
-            model.append((key_id, key_label))
+        self._connect(self._ui.cancel_button, "clicked", self._on_cancel)
+        self._connect(self._ui.ok_button, "clicked", self._on_ok)
+        self._connect(self._ui.search_entry, "search-changed", self._on_search)
+        self._connect(self._selection, "selection-changed", self._on_row_changed)
 
         self.set_child(self._ui.box)
         self.show()
 
+        thread = threading.Thread(
+            target=self._load_keys, args=(get_keys_func,), daemon=True
+        )
+        thread.start()
+
     def _cleanup(self) -> None:
+        self._loading_cancelled = True
         del self._callback
 
+    def _add_column(
+        self,
+        title: str,
+        on_bind: Callable[[Gtk.SignalListItemFactory, Gtk.ListItem], None],
+    ) -> None:
+        factory = Gtk.SignalListItemFactory()
+        self._connect(factory, "setup", self._on_factory_setup)
+        self._connect(factory, "bind", on_bind)
+        column = Gtk.ColumnViewColumn(title=title, factory=factory, expand=True)
+        self._ui.keys_view.append_column(column)
+
     @staticmethod
-    def _sort(
-        model: Gtk.TreeModel, iter1: Gtk.TreeIter, iter2: Gtk.TreeIter, _data: Any
-    ) -> int:
-        value1 = model[iter1][1]
-        value2 = model[iter2][1]
-        if value1 == _("None"):
-            return -1
-        if value2 == _("None"):
-            return 1
-        if value1 < value2:
-            return -1
-        return 1
+    def _on_factory_setup(
+        _factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem
+    ) -> None:
+        label = Gtk.Label(xalign=0, ellipsize=Pango.EllipsizeMode.END)
+        list_item.set_child(label)
+
+    @staticmethod
+    def _on_bind_key_id(
+        _factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem
+    ) -> None:
+        label = cast(Gtk.Label, list_item.get_child())
+        label.set_text(cast(KeyItem, list_item.get_item()).key_id)
+
+    @staticmethod
+    def _on_bind_key_user(
+        _factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem
+    ) -> None:
+        label = cast(Gtk.Label, list_item.get_child())
+        label.set_text(cast(KeyItem, list_item.get_item()).key_user)
+
+    def _load_keys(self, get_keys_func: Callable[[], dict[str, str]]) -> None:
+        # Runs in a worker thread, gpg must not block the main loop
+        try:
+            keys = sorted(get_keys_func().items(), key=lambda key: key[1])
+        except Exception as error:
+            log.exception("Could not load keys")
+            GLib.idle_add(self._on_keys_failed, str(error) or type(error).__name__)
+            return
+
+        for index in range(0, len(keys), LOAD_CHUNK_SIZE):
+            GLib.idle_add(self._add_keys, keys[index : index + LOAD_CHUNK_SIZE])
+        GLib.idle_add(self._on_keys_loaded)
+
+    def _add_keys(self, keys: list[tuple[str, str]]) -> bool:
+        if self._loading_cancelled:
+            return False
+        items = [KeyItem(key_id, key_user) for key_id, key_user in keys]
+        self._model.splice(self._model.get_n_items(), 0, items)
+        return False
+
+    def _on_keys_loaded(self) -> bool:
+        if not self._loading_cancelled:
+            self._ui.spinner.set_spinning(False)
+            self._ui.spinner.set_visible(False)
+        return False
+
+    def _on_keys_failed(self, error: str) -> bool:
+        if not self._loading_cancelled:
+            self._on_keys_loaded()
+            self._ui.error_label.set_text(_("Could not load keys: %s") % error)
+            self._ui.error_label.set_visible(True)
+        return False
+
+    def _on_search(self, entry: Gtk.SearchEntry) -> None:
+        self._filter.set_search(entry.get_text().casefold())
 
     def _on_cancel(self, _button: Gtk.Button) -> None:
         self.close()
@@ -188,14 +285,11 @@ class ChooseGPGKeyDialog(GajimAppWindow):
         self._callback(self._selected_key)
         self.close()
 
-    def _on_row_changed(self, treeview: Gtk.TreeView) -> None:
-        selection = treeview.get_selection()
-        model, iter_ = selection.get_selected()
-        if iter_ is None:
+    def _on_row_changed(
+        self, selection: Gtk.SingleSelection, _position: int, _n_items: int
+    ) -> None:
+        item = cast(KeyItem | None, selection.get_selected_item())
+        if item is None or item.key_id == _("None"):
             self._selected_key = None
         else:
-            key_id, key_user = model[iter_][0], model[iter_][1]
-            if key_id == _("None"):
-                self._selected_key = None
-            else:
-                self._selected_key = key_id, key_user
+            self._selected_key = item.key_id, item.key_user
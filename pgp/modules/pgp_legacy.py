@@ -19,8 +19,11 @@ from typing import Any
 import os
 import time
 from collections.abc import Callable
+from concurrent.futures import Future
+from functools import partial
 
 import nbxmpp
+from gi.repository import GLib
 from nbxmpp.client import Client as nbxmppClient
 from nbxmpp.namespaces import Namespace
 from nbxmpp.protocol import Message
@@ -38,12 +41,15 @@ from gajim.common.modules.base import BaseModule
 from gajim.common.structs import OutgoingMessage
 from gajim.plugins.plugins_i18n import _
 
+from pgp.backend.metrics import OperationStats
 from pgp.backend.python_gnupg import PGP
 from pgp.backend.store import KeyStore
 from pgp.exceptions import KeyMismatch
 from pgp.exceptions import NoKeyIdFound
 from pgp.exceptions import SignError
 from pgp.modules.events import PGPNotTrusted
+from pgp.modules.util import find_gpg
+from pgp.modules.util import parse_uid_address
 from pgp.modules.util import prepare_stanza
 
 # Module name
@@ -70,6 +76,11 @@ ALLOWED_TAGS = [
     ("reactions", Namespace.REACTIONS),
 ]
 
+# Lookup tables for a single pass over the stanza children,
+# tags without namespace are allowed in any namespace
+ALLOWED_TAG_SET = frozenset((tag, ns) for tag, ns in ALLOWED_TAGS if ns is not None)
+ALLOWED_ANY_NS_TAG_SET = frozenset(tag for tag, ns in ALLOWED_TAGS if ns is None)
+
 
 class PGPLegacy(BaseModule):
     def __init__(self, client: Client) -> None:
@@ -92,29 +103,94 @@ class PGPLegacy(BaseModule):
 
         self.own_jid = self._client.get_own_jid()
 
-        self._pgp = PGP()
-        self._store = KeyStore(
-            self._account, self.own_jid, self._log, self._pgp.list_keys
-        )
+        # gpg is only touched once the account actually uses PGP, the
+        # store does not access the disk before its first use either
+        self._pgp: PGP | None = None
+        self._store = KeyStore(self._account, self.own_jid, self._log, self._list_keys)
         self._always_trust: list[str] = []
         self._presence_fingerprint_store: dict[str, str] = {}
 
     @property
     def pgp_backend(self) -> PGP:
+        if self._pgp is None:
+            self._pgp = PGP(self._get_gpg_binary())
+            if (size := self._get_signature_cache_size()) is not None:
+                self._pgp.signature_service.cache.resize(size)
         return self._pgp
 
+    def _list_keys(self, *args: Any, **kwargs: Any) -> list[str]:
+        return self.pgp_backend.list_keys(*args, **kwargs)
+
+    def get_backend_metrics(self) -> dict[str, OperationStats]:
+        return self.pgp_backend.metrics.snapshot()
+
+    @staticmethod
+    def _get_gpg_binary() -> str:
+        # The binary probed on activation, so the backend runs the same one
+        plugin = app.plugin_manager.get_active_plugin("pgp")
+        if plugin is not None and plugin.binary is not None:  # pyright: ignore
+            return plugin.binary  # pyright: ignore
+        return find_gpg() or "gpg"
+
+    @staticmethod
+    def _get_signature_cache_size() -> int | None:
+        plugin = app.plugin_manager.get_active_plugin("pgp")
+        if plugin is None:
+            return None
+        return int(plugin.config["SIGNATURE_CACHE_SIZE"])  # pyright: ignore
+
     def set_own_key_data(self, keydata: tuple[str, str] | None) -> None:
+        if keydata is not None:
+            # The key may just have been imported or had its trust changed
+            self.pgp_backend.invalidate_key_cache()
         return self._store.set_own_key_data(keydata)
 
     def get_own_key_data(self) -> dict[str, str] | None:
         return self._store.get_own_key_data()
 
     def set_contact_key_data(self, jid: str, key_data: tuple[str, str] | None) -> None:
+        if key_data is not None:
+            # The key may just have been imported or had its trust changed
+            self.pgp_backend.invalidate_key_cache()
         return self._store.set_contact_key_data(jid, key_data)
 
     def get_contact_key_data(self, jid: str) -> dict[str, str] | None:
         return self._store.get_contact_key_data(jid)
 
+    def auto_assign_keys(self, overwrite: bool = False) -> int:
+        """
+        Assign keys to all roster contacts whose address matches a uid
+        of exactly one key in the keyring. Returns the number of assigned keys.
+        """
+        index: dict[str, dict[str, str]] = {}
+        for fingerprint, uids in self.pgp_backend.get_key_uids().items():
+            for uid in uids:
+                address = parse_uid_address(uid)
+                if address is None:
+                    continue
+                index.setdefault(address, {}).setdefault(fingerprint, uid)
+
+        assigned = 0
+        with self._store.transaction():
+            for contact in self._client.get_module("Roster").iter_contacts():
+                jid = str(contact.jid)
+                if not overwrite and self.get_contact_key_data(jid) is not None:
+                    continue
+
+                keys = index.get(jid.lower())
+                if keys is None:
+                    continue
+
+                if len(keys) > 1:
+                    self._log.info("Multiple keys found for %s, skipping", jid)
+                    continue
+
+                self._store.set_contact_key_data(jid, next(iter(keys.items())))
+                assigned += 1
+
+        self._log.info("Assigned keys to %s contacts", assigned)
+        return assigned
+
     def has_valid_key_assigned(self, jid: str) -> bool:
         key_data = self.get_contact_key_data(jid)
         if key_data is None:
@@ -139,7 +215,7 @@ class PGPLegacy(BaseModule):
         assert properties.jid is not None
         jid = properties.jid.bare
 
-        fingerprint = self._pgp.verify(properties.status, properties.signed)
+        fingerprint = self.pgp_backend.verify(properties.status, properties.signed)
         if fingerprint is None:
             self._log.info(
                 "Presence from %s was signed but no corresponding key was found", jid
@@ -178,7 +254,7 @@ class PGPLegacy(BaseModule):
         self._log.info("Message received from: %s", remote_jid)
 
         assert properties.pgp_legacy is not None
-        payload = self._pgp.decrypt(properties.pgp_legacy)
+        payload = self.pgp_backend.decrypt(properties.pgp_legacy)
         prepare_stanza(stanza, payload)
 
         properties.encrypted = EncryptionData(
@@ -205,6 +281,113 @@ class PGPLegacy(BaseModule):
         always_trust = key_id in self._always_trust
         self._encrypt(client, message, [key_id, own_key_id], callback, always_trust)
 
+    def encrypt_messages(
+        self,
+        client: Client,
+        messages: list[OutgoingMessage],
+        callback: Callable[[OutgoingMessage], None],
+    ) -> None:
+        """
+        Encrypt many messages concurrently. Messages with the same text are
+        encrypted once, to the keys of all their recipients and the own key.
+        Every recipient can see the key ids of the others in the result.
+        The callback is called once per message, on the main thread, like
+        for encrypt_message().
+        """
+        # Messages to keys which are always trusted are encrypted
+        # separately, so the others are still checked
+        groups: dict[tuple[str, bool], list[tuple[OutgoingMessage, str]]] = {}
+        own_key_id = None
+        for message in messages:
+            text = message.get_text()
+            if not text:
+                callback(message)
+                continue
+
+            to_jid = str(message.contact.jid)
+            try:
+                key_id, own_key_id = self._get_key_ids(to_jid)
+            except NoKeyIdFound as error:
+                self._log.warning(error)
+                continue
+
+            always_trust = key_id in self._always_trust
+            groups.setdefault((text, always_trust), []).append((message, key_id))
+
+        for (text, always_trust), group in groups.items():
+            assert own_key_id is not None
+            # Contact keys first, the own key is always the last recipient
+            recipients = [*dict.fromkeys(key_id for _, key_id in group), own_key_id]
+            future = self.pgp_backend.encrypt_async(text, recipients, always_trust)
+            future.add_done_callback(
+                partial(
+                    self._on_batch_encrypted,
+                    client,
+                    [message for message, _ in group],
+                    recipients,
+                    callback,
+                )
+            )
+
+    def _on_batch_encrypted(
+        self,
+        client: Client,
+        messages: list[OutgoingMessage],
+        recipients: list[str],
+        callback: Callable[[OutgoingMessage], None],
+        future: Future[tuple[str, str]],
+    ) -> None:
+        # Called from the backend worker thread
+        try:
+            encrypted_payload, error = future.result()
+        except Exception as exc:
+            self._log.exception("Encryption failed")
+            encrypted_payload, error = "", str(exc) or "Unknown"
+
+        def _finish() -> bool:
+            if error.startswith("NOT_TRUSTED"):
+                self._handle_batch_not_trusted(
+                    client, messages, recipients, callback, error
+                )
+                return False
+
+            for message in messages:
+                self._on_encrypted(
+                    client, message, recipients, callback, encrypted_payload, error
+                )
+            return False
+
+        GLib.idle_add(_finish)
+
+    def _handle_batch_not_trusted(
+        self,
+        client: Client,
+        messages: list[OutgoingMessage],
+        recipients: list[str],
+        callback: Callable[[OutgoingMessage], None],
+        error: str,
+    ) -> None:
+        # All messages of the group share text and keys,
+        # ask once and encrypt once again for all of them
+        text = messages[0].get_text()
+        assert text is not None
+
+        def on_yes(checked: bool) -> None:
+            if checked:
+                self._always_trust.extend(recipients[:-1])
+            future = self.pgp_backend.encrypt_async(text, recipients, True)
+            future.add_done_callback(
+                partial(
+                    self._on_batch_encrypted, client, messages, recipients, callback
+                )
+            )
+
+        def on_no() -> None:
+            for message in messages:
+                self._raise_message_not_sent(client, message, error)
+
+        app.ged.raise_event(PGPNotTrusted(on_yes=on_yes, on_no=on_no))
+
     def _encrypt(
         self,
         client: Client,
@@ -216,8 +399,22 @@ class PGPLegacy(BaseModule):
         text = message.get_text()
         assert text is not None
 
-        result = self._pgp.encrypt(text, recipients, always_trust)
-        encrypted_payload, error = result
+        encrypted_payload, error = self.pgp_backend.encrypt(
+            text, recipients, always_trust
+        )
+        self._on_encrypted(
+            client, message, recipients, callback, encrypted_payload, error
+        )
+
+    def _on_encrypted(
+        self,
+        client: Client,
+        message: OutgoingMessage,
+        recipients: list[str],
+        callback: Callable[[OutgoingMessage], None],
+        encrypted_payload: str,
+        error: str,
+    ) -> None:
         if error:
             self._handle_encrypt_error(client, error, message, recipients, callback)
             return
@@ -290,12 +487,14 @@ class PGPLegacy(BaseModule):
             self._log.warning("No own key id found, can’t sign presence")
             return
 
+        signature_service = self.pgp_backend.signature_service
         try:
-            result = self._pgp.sign(status, key_data["key_id"])
+            result = signature_service.sign(status or "", key_data["key_id"])
         except SignError as error:
             self._log.warning("Sign Error: %s", error)
             return
-        # self._log.debug(self._pgp.sign.cache_info())
+
+        self._log.debug(signature_service.cache.cache_info())
         self._log.info("Presence signed")
         presence.setTag(Namespace.SIGNED + " x").setData(result)
 
@@ -334,10 +533,20 @@ class PGPLegacy(BaseModule):
         if thread := original_stanza.getThread():
             stanza.setThread(thread)
 
-        for tag, ns in ALLOWED_TAGS:
-            node = original_stanza.getTag(tag, namespace=ns)
-            if node:
-                stanza.addChild(node=node)
+        seen: set[str | tuple[str, str]] = set()
+        for node in original_stanza.getChildren():
+            tag = node.getName()
+            if tag in ALLOWED_ANY_NS_TAG_SET:
+                key = tag
+            else:
+                key = (tag, node.getNamespace())
+                if key not in ALLOWED_TAG_SET:
+                    continue
+
+            if key in seen:
+                continue
+            seen.add(key)
+            stanza.addChild(node=node)
         message.set_stanza(stanza)
 
 
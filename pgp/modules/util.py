@@ -14,12 +14,36 @@
 # You should have received a copy of the GNU General Public License
 # along with PGP Gajim Plugin. If not, see <http://www.gnu.org/licenses/>.
 
-import os
+import json
+import logging
+import re
+import shutil
 import subprocess
+from pathlib import Path
 
 from nbxmpp import Message
 from nbxmpp.namespaces import Namespace
 
+from gajim.common import configpaths
+
+log = logging.getLogger("gajim.p.pgplegacy")
+
+UID_ADDRESS_RE = re.compile(r"<([^<>\s]+@[^<>\s]+)>")
+
+
+def parse_uid_address(uid: str) -> str | None:
+    """
+    Return the lowercased address of a uid like "Name <user@example.org>"
+    """
+    match = UID_ADDRESS_RE.search(uid)
+    if match is not None:
+        return match.group(1).lower()
+
+    uid = uid.strip()
+    if "@" in uid and " " not in uid:
+        return uid.lower()
+    return None
+
 
 def prepare_stanza(stanza: Message, plaintext: str) -> None:
     delete_nodes(stanza, "encrypted", Namespace.ENCRYPTED)
@@ -33,18 +57,56 @@ def delete_nodes(stanza: Message, name: str, namespace: str | None = None) -> No
         stanza.delChild(node)
 
 
-def find_gpg():
-    def _search(binary: str) -> bool:
-        if os.name == "nt":
-            gpg_cmd = binary + " -h >nul 2>&1"
-        else:
-            gpg_cmd = binary + " -h >/dev/null 2>&1"
-        if subprocess.call(gpg_cmd, shell=True):  # noqa: S602, SIM103
-            return False
-        return True
+def find_gpg() -> str | None:
+    """
+    Return the path of the gpg binary, found by PATH lookup only
+    """
+    for binary in ("gpg2", "gpg"):
+        if path := shutil.which(binary):
+            return path
+    return None
+
+
+def get_gpg_version(binary: str) -> str | None:
+    """
+    Return the version of the gpg binary. The result is cached on disk
+    and only probed again if the binary has been modified.
+    """
+    try:
+        mtime = Path(binary).stat().st_mtime_ns
+    except OSError as error:
+        log.warning("Unable to access %s: %s", binary, error)
+        return None
+
+    cache_path = Path(configpaths.get("PLUGINS_DATA")) / "pgplegacy" / "gpg_binary"
+    try:
+        with cache_path.open("r") as file:
+            cache = json.load(file)
+    except Exception:
+        cache = {}
+
+    entry = cache.get(binary)
+    if entry is not None and entry.get("mtime") == mtime:
+        return entry.get("version")
+
+    try:
+        result = subprocess.run(  # noqa: S603
+            [binary, "--version"], capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError) as error:
+        log.warning("Unable to run %s: %s", binary, error)
+        return None
+
+    # First line looks like "gpg (GnuPG) 2.2.40"
+    first_line = result.stdout.partition("\n")[0]
+    version = first_line.rsplit(" ", 1)[-1] or None
 
-    if _search("gpg2"):
-        return "gpg2"
+    cache[binary] = {"mtime": mtime, "version": version}
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with cache_path.open("w") as file:
+            json.dump(cache, file)
+    except OSError as error:
+        log.warning("Unable to write %s: %s", cache_path, error)
 
-    if _search("gpg"):
-        return "gpg"
+    return version
@@ -38,6 +38,7 @@ from gajim.gtk.alert import DialogResponse
 from gajim.gtk.alert import InformationAlertDialog
 from gajim.gtk.control import ChatControl
 from gajim.plugins import GajimPlugin
+from gajim.plugins.helpers import GajimPluginActivateException
 from gajim.plugins.plugins_i18n import _
 
 from pgp.exceptions import KeyMismatch
@@ -45,6 +46,7 @@ from pgp.gtk.config import PGPConfigDialog
 from pgp.gtk.key import KeyDialog
 from pgp.modules.events import PGPNotTrusted
 from pgp.modules.util import find_gpg
+from pgp.modules.util import get_gpg_version
 
 if TYPE_CHECKING:
     from pgp.modules.pgp_legacy import PGPLegacy
@@ -71,20 +73,22 @@ else:
         log.error("We need python-gnupg >= 0.3.8")
         error = True
 
-error_msg = None
-BINARY = find_gpg()
-log.info("Found GPG executable: %s", BINARY)
-
-if BINARY is None or error:
-    if os.name == "nt":
-        error_msg = _("Please install GnuPG / Gpg4win")
-    else:
-        error_msg = _("Please install python-gnupg and gnupg")
-
 
 class PGPPlugin(GajimPlugin):
     def init(self):
         self.description = _("PGP encryption as per XEP-0027")
+
+        # Only a PATH lookup here, the binary is run on first activation
+        self._binary = find_gpg()
+        self._gpg_version = None
+
+        error_msg = None
+        if self._binary is None or error:
+            if os.name == "nt":
+                error_msg = _("Please install GnuPG / Gpg4win")
+            else:
+                error_msg = _("Please install python-gnupg and gnupg")
+
         if error_msg:
             self.activatable = False
             self.config_dialog = None
@@ -92,6 +96,12 @@ class PGPPlugin(GajimPlugin):
             return
 
         self.config_dialog = partial(PGPConfigDialog, self)
+        self.config_default_values = {
+            "SIGNATURE_CACHE_SIZE": (
+                32,
+                "Number of presence signatures cached for all accounts",
+            ),
+        }
         self.encryption_name = ENCRYPTION_NAME
         self.gui_extension_points = {
             "encrypt" + ENCRYPTION_NAME: (self._encrypt_message, None),
@@ -109,12 +119,27 @@ class PGPPlugin(GajimPlugin):
             "pgp-not-trusted": (ged.PRECORE, self._on_not_trusted),
         }
 
+    @property
+    def binary(self) -> str | None:
+        return self._binary
+
     @staticmethod
     def get_pgp_module(account: str) -> PGPLegacy:
         return app.get_client(account).get_module("PGPLegacy")  # pyright: ignore
 
     def activate(self) -> None:
-        pass
+        if self._gpg_version is not None:
+            return
+
+        assert self._binary is not None
+        self._gpg_version = get_gpg_version(self._binary)
+        if self._gpg_version is None:
+            log.error("GPG executable %s is not usable", self._binary)
+            self.activatable = False
+            self.available_text = _("GnuPG executable %s is not usable") % self._binary
+            raise GajimPluginActivateException(self.available_text)
+
+        log.info("Found GPG executable: %s (%s)", self._binary, self._gpg_version)
 
     def deactivate(self) -> None:
         pass
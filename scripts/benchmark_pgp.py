@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+
+# Benchmarks the PGP plugin backend against a throwaway GNUPGHOME.
+# Needs gajim, nbxmpp, python-gnupg and gpg, but no network access.
+
+from __future__ import annotations
+
+from typing import Any
+
+import argparse
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from types import SimpleNamespace
+
+REPO_DIR = Path(__file__).parent.parent
+
+# Contacts the same text is sent to by encrypt_messages
+BATCH_CONTACTS = 8
+
+# Armored payload sizes in bytes for the armor strip and add routines
+ARMOR_SIZES = [1_000_000, 4_000_000, 16_000_000]
+
+logging.basicConfig(level="INFO", format="%(levelname)s: %(message)s")
+log = logging.getLogger()
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def generate_key(gpg: Any, email: str) -> str:
+    key_input = gpg.gen_key_input(
+        key_type="EDDSA",
+        key_curve="ed25519",
+        subkey_type="ECDH",
+        subkey_curve="cv25519",
+        name_real="Benchmark",
+        name_email=email,
+        no_protection=True,
+    )
+    result = gpg.gen_key(key_input)
+    if not result.fingerprint:
+        raise BenchmarkError("Key generation failed: %s" % result.stderr)
+    return result.fingerprint
+
+
+def remove_gnupg_home(gnupg_home: str) -> None:
+    # gpg started an agent for the throwaway home, it would keep running
+    # and the generated keys would stay on disk
+    try:
+        subprocess.run(
+            ["gpgconf", "--homedir", gnupg_home, "--kill", "all"],
+            check=True,
+            capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as error:
+        log.error("Could not stop gpg-agent of %s: %s", gnupg_home, error)
+
+    try:
+        shutil.rmtree(gnupg_home)
+    except OSError as error:
+        log.error("Could not remove %s: %s", gnupg_home, error)
+
+
+def measure(func: Callable[[], Any], iterations: int) -> list[float]:
+    timings: list[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, size: int, keys: int, timings: list[float]) -> None:
+    mean = statistics.mean(timings)
+    median = statistics.median(timings)
+    throughput = size / mean / 1024 if mean else 0
+    print(
+        "%-24s %10d %6d %10.2f %10.2f %10.2f %12.1f"
+        % (
+            name,
+            size,
+            keys,
+            mean * 1000,
+            median * 1000,
+            max(timings) * 1000,
+            throughput,
+        )
+    )
+
+
+class StanzaMessage:
+    """
+    The part of OutgoingMessage used by _cleanup_stanza
+    """
+
+    def __init__(self, stanza: Any) -> None:
+        self._stanza = stanza
+
+    def get_stanza(self) -> Any:
+        return self._stanza
+
+    def set_stanza(self, stanza: Any) -> None:
+        self._stanza = stanza
+
+
+class BatchMessage(StanzaMessage):
+    """
+    The part of OutgoingMessage used by encrypt_messages
+    """
+
+    def __init__(self, stanza: Any, text: str, jid: str) -> None:
+        super().__init__(stanza)
+        self._text = text
+        self.contact = SimpleNamespace(jid=jid)
+        self.encryption = None
+
+    def get_text(self) -> str:
+        return self._text
+
+    def set_encryption(self, encryption: Any) -> None:
+        self.encryption = encryption
+
+
+def build_stanzas() -> dict[str, Any]:
+    import nbxmpp
+    from nbxmpp.namespaces import Namespace
+
+    def _new_message() -> Any:
+        stanza = nbxmpp.Message(to="contact@example.org", typ="chat")
+        stanza.setID("6a1f2c3e")
+        stanza.setBody("Hello")
+        stanza.setTag("origin-id", namespace=Namespace.SID, attrs={"id": "6a1f2c3e"})
+        stanza.setTag("request", namespace=Namespace.RECEIPTS)
+        stanza.setTag("active", namespace=Namespace.CHATSTATES)
+        stanza.setTag("markable", namespace=Namespace.CHATMARKERS)
+        return stanza
+
+    plain = _new_message()
+
+    reply = _new_message()
+    reply.setThread("c0ffee")
+    reply.setTag(
+        "reply",
+        namespace=Namespace.REPLY,
+        attrs={"to": "contact@example.org", "id": "5b2e"},
+    )
+    fallback = reply.setTag(
+        "fallback", namespace=Namespace.FALLBACK, attrs={"for": Namespace.REPLY}
+    )
+    fallback.setTag("body", attrs={"start": "0", "end": "8"})
+    reply.setTag("store", namespace=Namespace.HINTS)
+
+    reaction = nbxmpp.Message(to="contact@example.org", typ="chat")
+    reaction.setID("7c3d")
+    reactions = reaction.setTag(
+        "reactions", namespace=Namespace.REACTIONS, attrs={"id": "5b2e"}
+    )
+    reactions.setTagData("reaction", "\N{THUMBS UP SIGN}")
+    reaction.setTag("store", namespace=Namespace.HINTS)
+
+    # Elements which are removed, as they would leak the plaintext
+    rich = _new_message()
+    rich.setTag("html", namespace=Namespace.XHTML_IM).setTag(
+        "body", namespace="http://www.w3.org/1999/xhtml"
+    ).setData("Hello")
+    rich.setTag("x", namespace="jabber:x:oob").setTagData(
+        "url", "https://example.org/file.png"
+    )
+    rich.setTag("nick", namespace=Namespace.NICK).setData("Benchmark")
+    rich.setTag("replace", namespace=Namespace.CORRECT, attrs={"id": "5b2e"})
+
+    return {"plain": plain, "reply": reply, "reaction": reaction, "rich": rich}
+
+
+def cleanup_stanza_per_tag(message: StanzaMessage) -> None:
+    # _cleanup_stanza before it was made a single pass,
+    # one getTag() lookup over all children per allowed tag
+    import nbxmpp
+
+    from pgp.modules.pgp_legacy import ALLOWED_TAGS
+
+    original_stanza = message.get_stanza()
+    stanza = nbxmpp.Message(to=original_stanza.getTo(), typ=original_stanza.getType())
+
+    if message_id := original_stanza.getID():
+        stanza.setID(message_id)
+
+    if thread := original_stanza.getThread():
+        stanza.setThread(thread)
+
+    for tag, ns in ALLOWED_TAGS:
+        node = original_stanza.getTag(tag, namespace=ns)
+        if node:
+            stanza.addChild(node=node)
+    message.set_stanza(stanza)
+
+
+def run_stanza_cleanup(module_class: Any, iterations: int) -> None:
+    for name, stanza in build_stanzas().items():
+        legacy_message = StanzaMessage(stanza)
+        cleanup_stanza_per_tag(legacy_message)
+        message = StanzaMessage(stanza)
+        module_class._cleanup_stanza(message)
+        if sorted(map(str, legacy_message.get_stanza().getChildren())) != sorted(
+            map(str, message.get_stanza().getChildren())
+        ):
+            raise BenchmarkError("Stanza cleanup results differ for %s" % name)
+
+        size = len(str(stanza).encode())
+        report(
+            "per tag (%s)" % name,
+            size,
+            0,
+            measure(
+                lambda s=stanza: cleanup_stanza_per_tag(StanzaMessage(s)), iterations
+            ),
+        )
+        report(
+            "single pass (%s)" % name,
+            size,
+            0,
+            measure(
+                lambda s=stanza: module_class._cleanup_stanza(StanzaMessage(s)),
+                iterations,
+            ),
+        )
+
+
+def strip_header_footer_remove(data: str) -> str:
+    # _strip_header_footer before it was made linear,
+    # every header line is removed from the front of the list
+    if not data:
+        return ""
+    lines = data.splitlines()
+    while lines[0] != "":
+        lines.remove(lines[0])
+    while lines[0] == "":
+        lines.remove(lines[0])
+    i = 0
+    for line in lines:
+        if line:
+            if line[0] == "-":
+                break
+        i = i + 1
+    line = "\n".join(lines[0:i])
+    return line
+
+
+def add_header_footer_concat(data: str, type_: str) -> str:
+    # _add_header_footer before it was made linear,
+    # the result is built by repeated concatenation
+    out = "-----BEGIN PGP %s-----" % type_ + os.linesep
+    out = out + "Version: PGP" + os.linesep
+    out = out + os.linesep
+    out = out + data + os.linesep
+    out = out + "-----END PGP %s-----" % type_ + os.linesep
+    return out
+
+
+def run_armor(backend_class: Any, iterations: int) -> None:
+    for size in ARMOR_SIZES:
+        # Base64 like ciphertext in lines of 64 chars
+        line_count = size // 65
+        payload = "\n".join("A" * 64 for _ in range(line_count))
+        armored = add_header_footer_concat(payload, "MESSAGE")
+
+        if backend_class._add_header_footer(payload, "MESSAGE") != armored:
+            raise BenchmarkError("Armor results differ for %s bytes" % size)
+        if backend_class._strip_header_footer(armored) != (
+            strip_header_footer_remove(armored)
+        ):
+            raise BenchmarkError("Stripped armor differs for %s bytes" % size)
+
+        measurements = {
+            "add armor (concat)": lambda data=payload: add_header_footer_concat(
+                data, "MESSAGE"
+            ),
+            "add armor": lambda data=payload: backend_class._add_header_footer(
+                data, "MESSAGE"
+            ),
+            "strip armor (remove)": lambda data=armored: strip_header_footer_remove(
+                data
+            ),
+            "strip armor": lambda data=armored: backend_class._strip_header_footer(
+                data
+            ),
+        }
+        for name, func in measurements.items():
+            report(name, len(armored), 0, measure(func, iterations))
+
+
+def run(payload_sizes: list[int], keyring_sizes: list[int], iterations: int) -> None:
+    # GNUPGHOME must be set before gnupg and the backend are imported,
+    # keep the path short because gpg-agent socket paths are limited
+    gnupg_home = tempfile.mkdtemp(prefix="gpg")
+    os.environ["GNUPGHOME"] = gnupg_home
+    sys.path.insert(0, str(REPO_DIR))
+
+    try:
+        import gnupg
+
+        from pgp.backend.python_gnupg import PGP
+        from pgp.modules.pgp_legacy import PGPLegacy
+        from pgp.modules.util import find_gpg
+
+        # The same lookup as the plugin, so the backend runs this binary too
+        binary = find_gpg()
+        if binary is None:
+            raise BenchmarkError("gpg not found")
+
+        gpg = gnupg.GPG(gpgbinary=binary, gnupghome=gnupg_home)
+        own_fingerprint = generate_key(gpg, "own@example.org")
+        contact_fingerprint = generate_key(gpg, "contact@example.org")
+        keyring_size = 2
+
+        pgp = PGP(binary)
+        recipients = [contact_fingerprint, own_fingerprint]
+
+        print(
+            "%-24s %10s %6s %10s %10s %10s %12s"
+            % ("operation", "bytes", "keys", "mean ms", "median ms", "max ms", "KiB/s")
+        )
+
+        run_stanza_cleanup(PGPLegacy, iterations * 100)
+        run_armor(PGP, iterations)
+
+        for target_size in sorted(keyring_sizes):
+            while keyring_size < target_size:
+                generate_key(gpg, "filler%s@example.org" % keyring_size)
+                keyring_size += 1
+
+            report(
+                "list_keys",
+                0,
+                keyring_size,
+                measure(pgp.list_keys, iterations),
+            )
+
+            for size in payload_sizes:
+                plaintext = "x" * size
+                encrypted, error = pgp.encrypt(plaintext, recipients)
+                if error:
+                    raise BenchmarkError("Encryption failed: %s" % error)
+
+                if pgp.decrypt(encrypted) != plaintext:
+                    raise BenchmarkError("Decrypted text does not match")
+
+                signature = pgp.sign(plaintext, own_fingerprint)
+                if pgp.verify(plaintext, signature) != own_fingerprint:
+                    raise BenchmarkError("Signature could not be verified")
+
+                def _decrypt_cold(encrypted: str = encrypted) -> None:
+                    pgp.decryption_cache.clear()
+                    pgp.decrypt(encrypted)
+
+                measurements = {
+                    "encrypt": lambda text=plaintext: pgp.encrypt(text, recipients),
+                    "decrypt": _decrypt_cold,
+                    "decrypt (cached)": lambda data=encrypted: pgp.decrypt(data),
+                    "sign": lambda text=plaintext: pgp.sign(text, own_fingerprint),
+                    "verify": lambda text=plaintext, sig=signature: pgp.verify(
+                        text, sig
+                    ),
+                }
+                for name, func in measurements.items():
+                    report(name, size, keyring_size, measure(func, iterations))
+
+                run_message_received(PGPLegacy, pgp, encrypted, plaintext, size)
+
+        run_encrypt_messages(
+            PGPLegacy, pgp, gpg, own_fingerprint, BATCH_CONTACTS, iterations
+        )
+
+    finally:
+        remove_gnupg_home(gnupg_home)
+
+
+def run_encrypt_messages(
+    module_class: Any,
+    pgp: Any,
+    gpg: Any,
+    own_fingerprint: str,
+    contact_count: int,
+    iterations: int,
+) -> None:
+    import nbxmpp
+    from gi.repository import GLib
+
+    contacts = {
+        "batch%s@example.org" % index: generate_key(gpg, "batch%s@example.org" % index)
+        for index in range(contact_count)
+    }
+    text = "x" * 1000
+
+    # encrypt_messages is called unbound, only the attributes
+    # it uses are set, so no client or account is needed
+    module = object.__new__(module_class)
+    module._pgp = pgp
+    module._log = log
+    module._always_trust = []
+    module._get_key_ids = lambda jid: (contacts[jid], own_fingerprint)
+
+    def _per_message() -> None:
+        for fingerprint in contacts.values():
+            pgp.encrypt(text, [fingerprint, own_fingerprint])
+
+    def _batch() -> None:
+        messages = [
+            BatchMessage(nbxmpp.Message(to=jid, typ="chat"), text, jid)
+            for jid in contacts
+        ]
+        done: list[Any] = []
+        module.encrypt_messages(None, messages, done.append)
+
+        context = GLib.MainContext.default()
+        while len(done) < len(messages):
+            context.iteration(True)
+        if any(message.encryption is None for message in messages):
+            raise BenchmarkError("Batch encryption failed")
+
+    report(
+        "encrypt (per message)",
+        len(text),
+        contact_count,
+        measure(_per_message, iterations),
+    )
+    report(
+        "encrypt_messages",
+        len(text),
+        contact_count,
+        measure(_batch, iterations),
+    )
+
+
+def run_message_received(
+    module_class: Any, pgp: Any, encrypted: str, plaintext: str, size: int
+) -> None:
+    import nbxmpp
+    from nbxmpp.namespaces import Namespace
+
+    # Only the attributes used by _message_received are provided,
+    # so no client or account is needed
+    module = SimpleNamespace(pgp_backend=pgp, _log=log)
+
+    def _receive() -> None:
+        stanza = nbxmpp.Message(to="own@example.org", typ="chat")
+        stanza.setBody("[This message is *encrypted* (See :XEP:`27`)]")
+        stanza.setTag("x", namespace=Namespace.ENCRYPTED).setData(encrypted)
+        properties = SimpleNamespace(
+            is_pgp_legacy=True,
+            from_muc=False,
+            remote_jid="contact@example.org",
+            pgp_legacy=encrypted,
+            encrypted=None,
+        )
+        pgp.decryption_cache.clear()
+        module_class._message_received(module, None, stanza, properties)
+        if stanza.getBody() != plaintext:
+            raise BenchmarkError("Received message was not decrypted")
+
+    report("_message_received", size, 0, measure(_receive, 5))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the PGP plugin")
+    parser.add_argument(
+        "--payload-sizes",
+        type=int,
+        nargs="+",
+        default=[100, 10_000, 1_000_000],
+        help="Payload sizes in bytes",
+    )
+    parser.add_argument(
+        "--keyring-sizes",
+        type=int,
+        nargs="+",
+        default=[2, 50],
+        help="Number of keys in the keyring",
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=10, help="Iterations per measurement"
+    )
+    args = parser.parse_args()
+
+    try:
+        run(args.payload_sizes, args.keyring_sizes, args.iterations)
+    except BenchmarkError as error:
+        sys.exit(str(error))
+
+
+if __name__ == "__main__":
+    main()